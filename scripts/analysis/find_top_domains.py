@@ -1,11 +1,23 @@
+from functools import lru_cache
 from pathlib import Path
 from typing import Counter
+from urllib.parse import urlsplit
 
 import tldextract
 from datasets import concatenate_datasets, load_dataset
 
 
-no_cache_extract = tldextract.TLDExtract(cache_dir=None)
+# Constructed once at import so that every `map` worker reuses it. Using the suffix list snapshot that ships with
+# tldextract (no `suffix_list_urls`) and its default on-disk cache means no HTTP fetch or re-parsing per worker
+extract = tldextract.TLDExtract(suffix_list_urls=())
+
+
+@lru_cache(maxsize=1_000_000)
+def get_registrable_domain(host: str) -> str:
+    # Cached on the host rather than the URL because many URLs share the same host
+    extracted = extract.extract_str(host)
+    return f"{extracted.domain}.{extracted.suffix}"
+
 
 LANGUAGES = [
     "fry_Latn",
@@ -51,8 +63,11 @@ def find_crawl_non_cc(lang: str, num_proc: int | None = None, include_removed: b
             datasets.append(ds)
 
     def get_domain(url):
-        extracted = no_cache_extract(url)
-        return {"domain": f"{extracted.domain}.{extracted.suffix}"}
+        try:
+            host = urlsplit(url).hostname or ""
+        except ValueError:
+            host = ""
+        return {"domain": get_registrable_domain(host)}
 
     ds_fw2 = concatenate_datasets(datasets).map(get_domain, num_proc=num_proc, input_columns=["url"])
     all_domains = set(ds_fw2.unique("domain"))
@@ -1,8 +1,6 @@
 from pathlib import Path
 
-import yaml
-
-from c5.script_utils import SlurmConfig, SlurmUploadConfig
+from c5.script_utils import SlurmConfig, SlurmUploadConfig, load_config
 
 
 def all_files_accounted_for(pdir: Path, num_files: int) -> list[int]:
@@ -23,9 +21,7 @@ def main(config_file: str, upload_config_file: str, log_dir: str, crawl_name: st
     :param log_dir: Directory where logs are stored.
     :param crawl_name: Name of the crawl to check.
     """
-    pfconfig = Path(config_file)
-    cfg = yaml.safe_load(pfconfig.read_text(encoding="utf-8"))
-    cfg = SlurmConfig(**cfg)
+    cfg = load_config(config_file, SlurmConfig)
 
     plog_dir = Path(log_dir)
 
@@ -67,9 +63,7 @@ def main(config_file: str, upload_config_file: str, log_dir: str, crawl_name: st
         print("[INFO] All containment tasks completed successfully for all languages.")
 
     # Upload tasks
-    pf_upl_config = Path(upload_config_file)
-    upl_cfg = yaml.safe_load(pf_upl_config.read_text(encoding="utf-8"))
-    upl_cfg = SlurmUploadConfig(**upl_cfg)
+    upl_cfg = load_config(upload_config_file, SlurmUploadConfig)
     num_upload_tasks = upl_cfg.tasks
     upload_tasks = plog_dir / "upload-logs" / crawl_name / "completions"
     if not upload_tasks.exists():
@@ -1,19 +1,24 @@
 """THIS FILE IS DEPRECATED AND MIGHT NOT WORK. IT IS HERE FOR LEGACY REASONS FOR ME TO REMEMBER HOW I DID IT."""
 
 import shutil
+from functools import lru_cache
 from pathlib import Path
 
-import duckdb
 import pyarrow as pa
-import pyarrow.compute as pc
 import pyarrow.parquet as pq
 from datasets.arrow_dataset import Dataset
 from huggingface_hub.file_download import hf_hub_download
 from huggingface_hub.hf_api import list_repo_files, upload_file
 
-from c5.data_utils import yield_repo_parquet_files
+from c5.data_utils import (
+    PARQUET_ROW_GROUP_SIZE,
+    PARQUET_WRITE_KWARGS,
+    atomic_parquet_writer,
+    verify_parquet_schema,
+    yield_repo_parquet_files,
+)
 from c5.script_utils import SCHEMA
-from c5.utils import extract_uuid
+from c5.utils import connect_duckdb, extract_uuid, get_available_cpus
 
 
 def check_eng_fw(ids, con):
@@ -48,7 +53,46 @@ def check_fw2(ids, dump, con):
     return {"found_in_fw": results}
 
 
-def main(dump: str, fw_duckdb_tmpl: str, fw2_duckdb_tmpl: str, overwrite: bool = False):
+@lru_cache(maxsize=None)
+def download_duckdb(repo_id: str, filename: str, local_dir: str) -> str:
+    """
+    Download a FineWeb(-2) DuckDB database. Results are cached per (repo_id, filename, local_dir) so that
+    the hub is only contacted once per database rather than once for every parquet file that needs it.
+    """
+    return hf_hub_download(repo_id=repo_id, filename=filename, local_dir=local_dir, repo_type="dataset")
+
+
+def rename_parquet_columns(local_fname: str, renames: dict[str, str]):
+    """
+    Rename columns of a parquet file by streaming its row groups into a new file. The original
+    compression codec and row group layout are kept, so the file is not fully loaded in memory
+    nor re-encoded at different settings.
+    """
+    pfin = pq.ParquetFile(local_fname)
+    schema = pfin.schema_arrow
+    new_names = [renames.get(name, name) for name in schema.names]
+    new_schema = pa.schema(
+        [field.with_name(name) for field, name in zip(schema, new_names)],
+        metadata=schema.metadata,
+    )
+    compression = pfin.metadata.row_group(0).column(0).compression if pfin.metadata.num_row_groups else "zstd"
+    # The footer uses the Parquet codec names (e.g. UNCOMPRESSED, LZ4_RAW), which differ from the writer's names
+    compression = {"uncompressed": "none", "lz4_raw": "lz4"}.get(compression.lower(), compression.lower())
+
+    with atomic_parquet_writer(local_fname, new_schema, compression=compression) as writer:
+        for rg_idx in range(pfin.num_row_groups):
+            writer.write_table(pfin.read_row_group(rg_idx).rename_columns(new_names))
+    pfin.close()
+
+
+def main(
+    dump: str,
+    fw_duckdb_tmpl: str,
+    fw2_duckdb_tmpl: str,
+    overwrite: bool = False,
+    duckdb_threads: int | None = None,
+    duckdb_memory_limit: str | None = "16GB",
+):
     """
     1. Fix older versions of the dataset by:
     - Renaming the `found_in_fw2` column to `found_in_fw` if it exists
@@ -73,6 +117,20 @@ def main(dump: str, fw_duckdb_tmpl: str, fw2_duckdb_tmpl: str, overwrite: bool =
     if dump not in all_dumps:
         raise ValueError(f"Dump {dump} not found in the repository.")
 
+    # Only keep the most recently used DuckDB connection open: all English files use the same FW database
+    # and the files of a FW-2 language are processed consecutively, so connections can be reused across files
+    open_cons = {}
+
+    def get_con(duckdb_path: str):
+        if duckdb_path not in open_cons:
+            for con in open_cons.values():
+                con.close()
+            open_cons.clear()
+            open_cons[duckdb_path] = connect_duckdb(
+                duckdb_path, threads=duckdb_threads, memory_limit=duckdb_memory_limit
+            )
+        return open_cons[duckdb_path]
+
     dump_year = int(dump.split("-")[2])
     dump_issue = int(dump.split("-")[3])
 
@@ -89,11 +147,12 @@ def main(dump: str, fw_duckdb_tmpl: str, fw2_duckdb_tmpl: str, overwrite: bool =
         # This should error, in which we first try to back off to the FW2_SCHEMA, and if that does not work to NO_FW_SCHEMA
         table = pq.read_table(local_fname, schema=SCHEMA)
 
-        changed_column_names = False
+        renamed_column = False
+        added_column = False
         if "found_in_fw2" in table.column_names:
             new_cols = ["found_in_fw" if col == "found_in_fw2" else col for col in table.column_names]
             table = table.rename_columns(new_cols)
-            changed_column_names = True
+            renamed_column = True
 
         if "found_in_fw" in table.column_names and overwrite:
             print(f"Overwriting {pf}: dropping `found_in_fw` column")
@@ -101,11 +160,8 @@ def main(dump: str, fw_duckdb_tmpl: str, fw2_duckdb_tmpl: str, overwrite: bool =
 
         if "found_in_fw" not in table.column_names:
             print(f"Adding `found_in_fw` column to {pf} with null values")
-            table = table.append_column(pa.field("found_in_fw", pa.bool_()), pc.chunked_array([None] * len(table)))
-            changed_column_names = True
-
-        if changed_column_names:
-            pq.write_table(table, local_fname, compression="zstd")
+            table = table.append_column(pa.field("found_in_fw", pa.bool_()), pa.nulls(len(table), pa.bool_()))
+            added_column = True
 
         assert "found_in_fw" in table.column_names
         assert "found_in_fw2" not in table.column_names
@@ -123,38 +179,28 @@ def main(dump: str, fw_duckdb_tmpl: str, fw2_duckdb_tmpl: str, overwrite: bool =
                 print(f"Skipping containment fix for {pf} because it is too recent for FW2")
                 needs_containment_fix = False
 
-        uniq_values_found_in_fw = pc.unique(table["found_in_fw"]).to_pylist()
-        if None not in uniq_values_found_in_fw:
-            if not set(uniq_values_found_in_fw).issubset({True, False}):
-                raise ValueError(
-                    f"Error at {pf}: Unexpected values in the `found_in_fw` column. expected True/False: {uniq_values_found_in_fw}"
-                )
-
+        # `found_in_fw` is a boolean column so it can only contain True/False/null: checking the (precomputed)
+        # null count is enough to know whether it exclusively contains True/False values
+        if table["found_in_fw"].null_count == 0:
             print(
                 f"Skipping containment fix for {pf} because it already has only True/False values in the `found_in_fw` column"
             )
             needs_containment_fix = False
 
         # If we need to check containment, do so on the Dataset. Easier to work with.
+        # Column changes are written together with the containment results, so no intermediate write is needed
         if needs_containment_fix:
-            ds = Dataset.from_parquet(local_fname)
+            ds = Dataset(table)
 
             if lang.startswith("eng"):
                 pfw = Path(fw_duckdb_tmpl.format(dump=dump))
-                duckdb_path = hf_hub_download(
-                    repo_id="BramVanroy/fineweb-duckdbs", filename=pfw.name, local_dir=pfw.parent, repo_type="dataset"
-                )
-                con = duckdb.connect(duckdb_path, read_only=True)
+                duckdb_path = download_duckdb("BramVanroy/fineweb-duckdbs", pfw.name, str(pfw.parent))
+                con = get_con(duckdb_path)
                 ds = ds.map(check_eng_fw, batched=True, fn_kwargs={"con": con}, input_columns="id", batch_size=10_000)
             else:
                 pfw = Path(fw2_duckdb_tmpl.format(lang=lang))
-                duckdb_path = hf_hub_download(
-                    repo_id="BramVanroy/fineweb-2-duckdbs",
-                    filename=pfw.name,
-                    local_dir=pfw.parent,
-                    repo_type="dataset",
-                )
-                con = duckdb.connect(duckdb_path, read_only=True)
+                duckdb_path = download_duckdb("BramVanroy/fineweb-2-duckdbs", pfw.name, str(pfw.parent))
+                con = get_con(duckdb_path)
                 ds = ds.map(
                     check_fw2,
                     batched=True,
@@ -163,19 +209,20 @@ def main(dump: str, fw_duckdb_tmpl: str, fw2_duckdb_tmpl: str, overwrite: bool =
                     batch_size=10_000,
                 )
 
-            con.close()
-            ds.to_parquet(local_fname)
+            ds.to_parquet(local_fname, batch_size=PARQUET_ROW_GROUP_SIZE, **PARQUET_WRITE_KWARGS)
 
             assert "found_in_fw" in ds.column_names
             assert "found_in_fw2" not in ds.column_names
+        elif added_column:
+            pq.write_table(table, local_fname, row_group_size=PARQUET_ROW_GROUP_SIZE, **PARQUET_WRITE_KWARGS)
+        elif renamed_column:
+            # Only the column name changed, so there is no need to re-encode the data at different settings
+            rename_parquet_columns(local_fname, {"found_in_fw2": "found_in_fw"})
 
         # File was updated, either by only changing column names or by adding values to the `found_in_fw` column
-        if changed_column_names or needs_containment_fix:
+        if renamed_column or added_column or needs_containment_fix:
             # Test that the modified files can indeed be read correctly now with the right schema
-            try:
-                table = pq.read_table(local_fname, schema=SCHEMA)
-            except Exception as exc:
-                raise Exception(f"Could not read modified {local_fname}") from exc
+            verify_parquet_schema(local_fname, SCHEMA)
 
             print(f"Uploading {pf} to {remote_parquet_uri}")
             num_retries = 3
@@ -196,6 +243,9 @@ def main(dump: str, fw_duckdb_tmpl: str, fw2_duckdb_tmpl: str, overwrite: bool =
                 else:
                     break
 
+    for con in open_cons.values():
+        con.close()
+
     shutil.rmtree(tmp_dir)
     print("Done")
 
@@ -226,6 +276,18 @@ if __name__ == "__main__":
         action="store_true",
         help="Overwrite the `found_in_fw` column if it already exists",
     )
+    cparser.add_argument(
+        "--duckdb_threads",
+        type=int,
+        default=get_available_cpus(),
+        help="Number of threads DuckDB may use for the containment queries",
+    )
+    cparser.add_argument(
+        "--duckdb_memory_limit",
+        type=str,
+        default="16GB",
+        help="Memory limit for DuckDB (e.g. '16GB') to prevent swapping",
+    )
 
     cli_kwargs = vars(cparser.parse_args())
     main(**cli_kwargs)
@@ -1,49 +1,93 @@
+import os
 import shutil
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import Literal
 
+import pyarrow as pa
+import pyarrow.compute as pc
 import pyarrow.parquet as pq
-from datasets import Dataset, Features
 from huggingface_hub import create_repo, list_repo_files
 
-from c5.data_utils import upload_with_retry, yield_repo_parquet_files
+from c5.data_utils import (
+    PARQUET_ROW_GROUP_SIZE,
+    PARQUET_WRITE_KWARGS,
+    atomic_parquet_writer,
+    prefetch,
+    upload_folder_with_retry,
+    verify_parquet_schema,
+    yield_repo_parquet_files,
+)
 from c5.script_utils import SCHEMA_NULLABLE
 
 
-def is_fineweb(row: dict) -> bool:
-    """
-    Check if the document is in FineWeb(-2) based on the 'found_in_fw' field.
-    """
-    return row.get("found_in_fw", False) is True
+# Arrow filter expressions (evaluated per row group) to select the documents of each version
+# fine: the document is in FineWeb(-2)
+FINE_FILTER = pc.equal(pc.field("found_in_fw"), True)
+# strict: the document is in FineWeb(-2), there is no license disagreement, the license allows commercial use
+# and is known, and it is not from a wiki
+STRICT_FILTER = (
+    pc.invert(pc.coalesce(pc.field("license_disagreement"), False))
+    & pc.equal(pc.field("found_in_fw"), True)
+    & pc.invert(pc.match_substring(pc.field("license_abbr"), "nc"))
+    & pc.not_equal(pc.field("license_abbr"), "cc-unknown")
+    & pc.invert(pc.match_substring(pc.field("url"), "wiki"))
+)
 
 
-def is_strict(row: dict) -> bool:
+def filter_parquet_file(local_fname: str, filter_expr: pc.Expression, schema: pa.Schema) -> int:
     """
-    Check if the document is strict based on the 'found_in_fw' and 'license_abbr' fields.
+    Filter a parquet file in place by streaming its row groups through the given filter expression,
+    so that the file never has to be fully loaded in memory. The `found_in_fw` column is dropped.
+
+    Args:
+        local_fname (str): The path to the local parquet file.
+        filter_expr (pc.Expression): The filter expression that selects which rows to keep.
+        schema (pa.Schema): The schema of the filtered file.
+
+    Returns:
+        int: The number of rows that were kept. If no rows were kept, the file is removed.
     """
-    return (
-        (not row["license_disagreement"])
-        and row["found_in_fw"]
-        and "nc" not in row["license_abbr"]
-        and row["license_abbr"] != "cc-unknown"
-        and "wiki" not in row["url"]
-    )
+    n_written = 0
+    with (
+        pq.ParquetFile(local_fname) as pfin,
+        atomic_parquet_writer(local_fname, schema, **PARQUET_WRITE_KWARGS) as writer,
+    ):
+        for rg_idx in range(pfin.num_row_groups):
+            table = pfin.read_row_group(rg_idx).cast(SCHEMA_NULLABLE).filter(filter_expr)
+            if table.num_rows:
+                writer.write_table(table.drop_columns(["found_in_fw"]), row_group_size=PARQUET_ROW_GROUP_SIZE)
+                n_written += table.num_rows
+
+    if n_written == 0:
+        os.unlink(local_fname)
+
+    return n_written
 
 
 def main(
     version: Literal["fine", "strict"] = "fine",
     skip_dumps: list[str] = None,
     only_dumps: list[str] = None,
-    num_proc: int | None = None,
     overwrite: bool = False,
+    max_parallel_uploads: int = 4,
+    max_parallel_downloads: int = 4,
 ):
     """
     Filter rows on whether or not they are in FineWeb(-2).
 
+    The next parquet file is downloaded in the background while the current one is being filtered.
+    Filtered files are buffered per crawl and uploaded in a single commit per crawl, in the background
+    while the next crawl is being processed, so that network and CPU-bound work overlap. At most
+    `max_parallel_uploads` filtered crawls are kept on disk while they wait to be uploaded.
+
     Args:
         skip_dumps (list[str]): List of dumps to skip.
         only_dumps (list[str]): List of dumps to process.
-        num_proc (int | None): Number of processes to use for multiprocessing.
+        max_parallel_uploads (int): Maximum number of crawls to upload concurrently. Before the next crawl is
+        processed, the oldest upload is waited for once this many are pending.
+        max_parallel_downloads (int): Maximum number of files to download concurrently.
     """
     if version not in ["fine", "strict"]:
         raise ValueError(f"Invalid version: {version}. Must be 'fine' or 'strict'.")
@@ -74,46 +118,62 @@ def main(
     crawls = {f.split("/")[1] for f in repo_fs if f.startswith("data/") and f.endswith(".parquet")}
     crawls = {c for c in crawls if c not in skip_dumps and (not only_dumps or c in only_dumps)}
 
-    already_processed_remote_fs = list_repo_files(filter_dataset_name, repo_type="dataset")
-
-    for crawl in crawls:
-        crawl_tmp_dir = tmp_dir / crawl
-        crawl_tmp_dir.mkdir(parents=True, exist_ok=True)
-        print(f"Processing {crawl}...")
-        for remote_parquet_uri, local_fname in yield_repo_parquet_files(
-            orig_dataset_name,
-            tmp_dir=str(crawl_tmp_dir),
-            only_dumps=[crawl],
-            skip_files_with_suffix=[] if overwrite else already_processed_remote_fs,
-            skip_non_fineweb_dumps=True,
-        ):
-            features = Features.from_arrow_schema(SCHEMA_NULLABLE)
-            ds = Dataset.from_parquet(local_fname, features=features)
-
-            ds = ds.filter(
-                is_fineweb if version == "fine" else is_strict,
-                desc="Filtering",
-                num_proc=num_proc,
-            ).remove_columns("found_in_fw")
-
-            if len(ds) > 0:
-                ds.to_parquet(local_fname)
-                # Test that the modified files can indeed be read correctly now with the right schema
-                try:
-                    _ = pq.read_table(local_fname, schema=SCHEMA_NULLABLE)
-                except Exception as exc:
-                    raise Exception(f"Could not read modified {local_fname}") from exc
-
-                upload_with_retry(
-                    repo_id=filter_dataset_name,
-                    local_fname=local_fname,
-                    remote_parquet_uri=remote_parquet_uri,
-                )
-            else:
-                print(f"No items left after filtering in {local_fname}. Skipping upload...")
+    already_processed_remote_fs = frozenset(list_repo_files(filter_dataset_name, repo_type="dataset"))
 
+    def upload_crawl(crawl_tmp_dir: Path):
+        upload_folder_with_retry(
+            repo_id=filter_dataset_name,
+            folder_path=crawl_tmp_dir,
+            allow_patterns=["*.parquet"],
+            commit_message=f"Add {crawl_tmp_dir.name}",
+        )
         shutil.rmtree(crawl_tmp_dir)
-        print(f"Processed {crawl}.")
+        print(f"Uploaded {crawl_tmp_dir.name}.")
+
+    # The filtered datasets do not have the `found_in_fw` column anymore
+    filtered_schema = SCHEMA_NULLABLE.remove(SCHEMA_NULLABLE.get_field_index("found_in_fw"))
+    filter_expr = FINE_FILTER if version == "fine" else STRICT_FILTER
+
+    with ThreadPoolExecutor(max_workers=max_parallel_uploads) as upload_executor:
+        upload_futures = deque()
+        for crawl in crawls:
+            # Limit the number of filtered crawls that are waiting to be uploaded (and taking up disk space)
+            while len(upload_futures) >= max_parallel_uploads:
+                upload_futures.popleft().result()
+
+            crawl_tmp_dir = tmp_dir / crawl
+            crawl_tmp_dir.mkdir(parents=True, exist_ok=True)
+            print(f"Processing {crawl}...")
+            for _, local_fname in prefetch(
+                yield_repo_parquet_files(
+                    orig_dataset_name,
+                    tmp_dir=str(crawl_tmp_dir),
+                    only_dumps=[crawl],
+                    skip_files=None if overwrite else already_processed_remote_fs,
+                    skip_non_fineweb_dumps=True,
+                    max_workers=max_parallel_downloads,
+                ),
+                # Remove files that were downloaded ahead but not processed, if processing stops early
+                discard=lambda item: Path(item[1]).unlink(missing_ok=True),
+            ):
+                # If no rows are left, the file is removed so that it is not picked up by the folder upload
+                n_written = filter_parquet_file(local_fname, filter_expr, filtered_schema)
+
+                if n_written > 0:
+                    # Test that the modified files can indeed be read correctly now with the right schema
+                    verify_parquet_schema(local_fname, filtered_schema)
+                else:
+                    print(f"No items left after filtering in {local_fname}. Skipping upload...")
+
+            # The downloaded files mirror the repo structure (data/<crawl>/<lang>/*.parquet) inside
+            # crawl_tmp_dir, so the whole crawl can be uploaded in one commit
+            upload_futures.append(upload_executor.submit(upload_crawl, crawl_tmp_dir))
+            print(f"Processed {crawl}.")
+
+        # Wait for all uploads to finish (and raise their errors, if any)
+        for future in upload_futures:
+            future.result()
+
     print("Done")
 
 
@@ -142,19 +202,24 @@ if __name__ == "__main__":
         default=[],
         help="Only process these dumps (e.g. CC-MAIN-2021-04)",
     )
-    cparser.add_argument(
-        "-j",
-        "--num-proc",
-        type=int,
-        default=None,
-        help="Number of processes to use for multiprocessing (default: None)",
-    )
     cparser.add_argument(
         "--overwrite",
         action="store_true",
         help="Overwrite existing files in the remote dataset,"
         "i.e. reprocess the ones that are already in the HQ version",
     )
+    cparser.add_argument(
+        "--max-parallel-uploads",
+        type=int,
+        default=4,
+        help="Maximum number of crawls to upload concurrently",
+    )
+    cparser.add_argument(
+        "--max-parallel-downloads",
+        type=int,
+        default=4,
+        help="Maximum number of files to download concurrently",
+    )
 
     cli_kwargs = vars(cparser.parse_args())
     main(**cli_kwargs)
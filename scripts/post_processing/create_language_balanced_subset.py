@@ -1,23 +1,38 @@
-from datasets import Dataset, load_dataset
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+from datasets import load_dataset
+
+
+# Non-whitespace runs, with the same whitespace characters as `str.split()` (RE2's \s is ASCII-only)
+WORD_PATTERN = r"[^\s\v\x{1c}-\x{1f}\x{85}\p{Z}]+"
+
+
+def has_min_words(texts: pa.Array, min_words: int = 40) -> list[bool]:
+    """Vectorized equivalent of `text and len(text.split()) >= min_words` over a batch of texts."""
+    num_words = pc.count_substring_regex(texts, WORD_PATTERN)
+    return pc.and_kleene(pc.is_valid(texts), pc.greater_equal(num_words, min_words)).to_pylist()
 
 
 def main(
     languages: list[str],
     max_samples_per_lang: int = 5000,
+    num_upload_proc: int | None = None,
 ):
     ds = load_dataset("BramVanroy/CommonCrawl-CreativeCommons-fine", split="train").shuffle(seed=42)
-    ds = ds.filter(lambda text: text and len(text.split()) >= 40, num_proc=96, input_columns=["text"])
-    ds = ds.add_column("index", list(range(len(ds))))
-    uniq_langs = ds.unique("language")
+    ds = ds.with_format("arrow").filter(
+        has_min_words, batched=True, batch_size=10_000, input_columns=["text"], desc="Filtering on word count"
+    )
 
-    sample_idxs = []
-    counts = {lang: 0 for lang in uniq_langs if lang in languages}
-    for lang in uniq_langs:
-        lang_ds = ds.filter(lambda col_lang: col_lang == lang, input_columns="language", num_proc=96)
-        target_n = min(len(lang_ds), max_samples_per_lang)
-        sample_idxs.extend(lang_ds["index"][:target_n])
-        counts[lang] = target_n
+    # Group the row positions by language in a single pass. Without threads, the groups as well as the
+    # positions within each group keep their (shuffled) order, so we can take the first N of each group
+    languages_col = ds.with_format("arrow")["language"]
+    positions = pa.table({"language": languages_col, "index": np.arange(len(languages_col))})
+    grouped = positions.group_by("language", use_threads=False).aggregate([("index", "list")])
+    lang_sample_idxs = pc.list_slice(grouped["index_list"], 0, max_samples_per_lang)
 
+    sample_idxs = pc.list_flatten(lang_sample_idxs).to_numpy()
+    counts = dict(zip(grouped["language"].to_pylist(), pc.list_value_length(lang_sample_idxs).to_pylist()))
     print(counts)
 
     # Convert number to k, M
@@ -30,7 +45,10 @@ def main(
 
     sampled_ds = ds.select(sample_idxs)
     print(sampled_ds)
-    sampled_ds.push_to_hub(f"BramVanroy/CommonCrawl-CreativeCommons-fine-language-{num_str}", private=True)
+    # Shards are uploaded in parallel with num_upload_proc processes
+    sampled_ds.push_to_hub(
+        f"BramVanroy/CommonCrawl-CreativeCommons-fine-language-{num_str}", private=True, num_proc=num_upload_proc
+    )
 
 
 if __name__ == "__main__":
@@ -60,5 +78,12 @@ if __name__ == "__main__":
     cparser.add_argument(
         "-n", "--max-samples-per-lang", type=int, default=5000, help="Maximum number of samples per language"
     )
+    cparser.add_argument(
+        "--num-upload-proc",
+        type=int,
+        default=None,
+        help="Number of processes to prepare and upload the parquet shards with. By default they are uploaded one"
+        " after the other",
+    )
     args = cparser.parse_args()
     main(**vars(args))
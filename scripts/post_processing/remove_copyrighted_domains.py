@@ -1,25 +1,74 @@
+import json
 import os
 import shutil
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+import pyarrow.compute as pc
 import pyarrow.parquet as pq
-import tldextract
-from datasets import Features, load_dataset
-from datasets.arrow_dataset import Dataset
-from huggingface_hub.hf_api import upload_file
+from huggingface_hub.hf_api import RepoFile, list_repo_tree
+
+from c5.data_utils import (
+    PARQUET_ROW_GROUP_SIZE,
+    PARQUET_WRITE_KWARGS,
+    atomic_parquet_writer,
+    compute_keep_mask,
+    prefetch,
+    upload_with_retry,
+    verify_parquet_schema,
+    yield_repo_parquet_files,
+)
+from c5.script_utils import SCHEMA_NULLABLE, get_fw_c_and_d_domains
+from c5.utils import PROJECT_ROOT, generate_base64_hash
+
+
+def remove_domains_from_parquet(local_fname: str, remove_domains: frozenset[str]) -> int:
+    """
+    Remove the rows whose URL belongs to one of the given domains from a parquet file, one row group at a time.
+    First only the `url` column is read to find the rows to remove. Only if there are any, the row groups are
+    filtered and streamed into a new file that replaces the original one.
+
+    Args:
+        local_fname (str): The path to the local parquet file.
+        remove_domains (frozenset[str]): The domains to remove.
+
+    Returns:
+        int: The number of removed rows.
+    """
+    with pq.ParquetFile(local_fname) as pfin:
+        keep_masks = [
+            compute_keep_mask(pfin.read_row_group(rg_idx, columns=["url"])["url"], remove_domains)
+            for rg_idx in range(pfin.num_row_groups)
+        ]
+        num_removed = sum(len(mask) - pc.sum(mask, min_count=0).as_py() for mask in keep_masks)
+        if not num_removed:
+            return 0
 
-from c5.data_utils import yield_repo_parquet_files
-from c5.script_utils import SCHEMA_NULLABLE
+        with atomic_parquet_writer(local_fname, SCHEMA_NULLABLE, **PARQUET_WRITE_KWARGS) as writer:
+            for rg_idx, mask in enumerate(keep_masks):
+                # The types are unchanged, so the cast only swaps in the nullable fields without copying buffers
+                table = pfin.read_row_group(rg_idx).filter(mask).cast(SCHEMA_NULLABLE)
+                writer.write_table(table, row_group_size=PARQUET_ROW_GROUP_SIZE)
 
+    return num_removed
 
-no_cache_extract = tldextract.TLDExtract(cache_dir=None)
+
+def write_manifest(pf_manifest: Path, clean_files: dict[str, str]):
+    """Write the manifest of clean files to a temporary file first, so that an interrupted write cannot corrupt it."""
+    pftmp = pf_manifest.with_name(f"{pf_manifest.name}.{os.getpid()}.tmp")
+    pftmp.write_text(json.dumps(clean_files), encoding="utf-8")
+    os.replace(pftmp, pf_manifest)
 
 
 def main(
     dataset_name: str = "BramVanroy/CommonCrawl-CreativeCommons",
     skip_dumps: list[str] = None,
     only_dumps: list[str] = None,
-    num_proc: int | None = None,
+    recheck: bool = False,
+    max_parallel_uploads: int = 2,
+    max_parallel_downloads: int = 4,
+    manifest_write_interval: int = 100,
 ):
     """
     Remove rows with domains that are known to be C&D'd from the CommonCrawl-CreativeCommons dataset.
@@ -29,76 +78,96 @@ def main(
         dataset_name (str): The name of the dataset to process.
         skip_dumps (list[str]): List of dumps to skip.
         only_dumps (list[str]): List of dumps to process.
-        num_proc (int | None): Number of processes to use for multiprocessing.
+        recheck (bool): If True, also process files that were found to be clean in a previous run.
+        Otherwise, files are skipped (without downloading them) if they have not changed since they were
+        found to be clean with the same list of domains.
+        max_parallel_uploads (int): Maximum number of files to upload concurrently.
+        max_parallel_downloads (int): Maximum number of files to download concurrently.
+        manifest_write_interval (int): Write the manifest of clean files after every this many newly found clean
+        files. It is always written when the script ends, also when it fails.
     """
-    ds_domains = load_dataset("BramVanroy/finewebs-copyright-domains", split="train")
-    remove_domains = set(ds_domains.unique("domain"))
-    del ds_domains
+    # Frozen so that the domain lookup used by `compute_keep_mask` is only built once
+    remove_domains = frozenset(get_fw_c_and_d_domains())
     print("Domains to remove:")
     print(remove_domains)
 
+    # Keep track of files that did not contain any of the domains, keyed by their git blob ID (which changes when
+    # the file changes). The manifest is specific to the list of domains: new domains require re-checking all files
+    domains_hash = generate_base64_hash("\n".join(sorted(remove_domains)))
+    pf_manifest = PROJECT_ROOT / ".cache" / "remove_domains" / f"{domains_hash}.json"
+    pf_manifest.parent.mkdir(parents=True, exist_ok=True)
+    clean_files = json.loads(pf_manifest.read_text(encoding="utf-8")) if pf_manifest.exists() else {}
+
+    repo_blob_ids = {
+        f.path: f.blob_id
+        for f in list_repo_tree(dataset_name, path_in_repo="data", recursive=True, repo_type="dataset")
+        if isinstance(f, RepoFile) and f.path.endswith(".parquet")
+    }
+    skip_files = (
+        frozenset()
+        if recheck
+        else frozenset(f for f, blob_id in repo_blob_ids.items() if clean_files.get(f) == blob_id)
+    )
+    print(f"Skipping {len(skip_files)} files that were already found to be clean in a previous run")
+
     tmp_dir = Path(__file__).parents[2] / "tmp" / "remove_domains"
     tmp_dir.mkdir(parents=True, exist_ok=True)
     tmp_dir = str(tmp_dir)
 
-    for remote_parquet_uri, local_fname in yield_repo_parquet_files(
-        dataset_name,
-        tmp_dir=tmp_dir,
-        only_dumps=only_dumps,
-        skip_dumps=skip_dumps,
-    ):
-        features = Features.from_arrow_schema(SCHEMA_NULLABLE)
-        ds = Dataset.from_parquet(local_fname, features=features)
-        num_items = len(ds)
-
-        def get_domain(url):
-            extracted = no_cache_extract(url)
-            return {"domain": f"{extracted.domain}.{extracted.suffix}"}
-
-        ds = ds.map(get_domain, num_proc=num_proc, input_columns=["url"], desc="Extracting domains")
-        ds = (
-            ds.filter(
-                lambda domain: domain not in remove_domains,
-                input_columns=["domain"],
-                desc="Filtering out removed domains",
-                num_proc=num_proc,
-            )
-            .remove_columns("domain")
-            .cast(features=features)
+    def upload_and_remove(local_fname: str, remote_parquet_uri: str):
+        upload_with_retry(
+            repo_id=dataset_name,
+            local_fname=local_fname,
+            remote_parquet_uri=remote_parquet_uri,
+            commit_message="Remove rows with C&D domains",
         )
-        new_num_items = len(ds)
-
-        if new_num_items < num_items:
-            print(f"Removed {num_items - new_num_items} rows with removed domains in {local_fname}")
-            ds.to_parquet(local_fname)
-            # Test that the modified files can indeed be read correctly now with the right schema
-            try:
-                _ = pq.read_table(local_fname, schema=SCHEMA_NULLABLE)
-            except Exception as exc:
-                raise Exception(f"Could not read modified {local_fname}") from exc
-
-            num_retries = 3
-            while num_retries:
-                try:
-                    upload_file(
-                        path_or_fileobj=local_fname,
-                        path_in_repo=remote_parquet_uri,
-                        repo_type="dataset",
-                        repo_id=dataset_name,
-                        commit_message="Remove rows with C&D domains",
-                    )
-                except Exception as exc:
-                    num_retries -= 1
-                    print(f"Error uploading {local_fname}: {exc}")
-                    if not num_retries:
-                        raise exc
-                else:
-                    break
-        else:
-            print(f"No rows with removed domains in {local_fname}")
-
         os.unlink(local_fname)
 
+    # Uploads happen in the background so that the next files can already be downloaded and filtered
+    num_unwritten_clean_files = 0
+    try:
+        with ThreadPoolExecutor(max_workers=max_parallel_uploads) as upload_executor:
+            upload_futures = deque()
+            for remote_parquet_uri, local_fname in prefetch(
+                yield_repo_parquet_files(
+                    dataset_name,
+                    tmp_dir=tmp_dir,
+                    only_dumps=only_dumps,
+                    skip_dumps=skip_dumps,
+                    skip_files=skip_files,
+                    max_workers=max_parallel_downloads,
+                ),
+                # Remove files that were downloaded ahead but not processed, if processing stops early
+                discard=lambda item: Path(item[1]).unlink(missing_ok=True),
+            ):
+                num_removed = remove_domains_from_parquet(local_fname, remove_domains)
+
+                if num_removed:
+                    print(f"Removed {num_removed} rows with removed domains in {local_fname}")
+                    # Test that the modified files can indeed be read correctly now with the right schema
+                    verify_parquet_schema(local_fname, SCHEMA_NULLABLE)
+
+                    upload_futures.append(upload_executor.submit(upload_and_remove, local_fname, remote_parquet_uri))
+                    # Limit the number of files that are waiting to be uploaded (and taking up disk space)
+                    while len(upload_futures) > max_parallel_uploads:
+                        upload_futures.popleft().result()
+                else:
+                    print(f"No rows with removed domains in {local_fname}")
+                    clean_files[remote_parquet_uri] = repo_blob_ids[remote_parquet_uri]
+                    os.unlink(local_fname)
+                    num_unwritten_clean_files += 1
+                    if num_unwritten_clean_files >= manifest_write_interval:
+                        write_manifest(pf_manifest, clean_files)
+                        num_unwritten_clean_files = 0
+
+            # Wait for the remaining uploads to finish (and raise their errors, if any)
+            for future in upload_futures:
+                future.result()
+    finally:
+        # Also keep track of the clean files that were found before a failure
+        if num_unwritten_clean_files:
+            write_manifest(pf_manifest, clean_files)
+
     shutil.rmtree(tmp_dir)
     print("Done")
 
@@ -124,11 +193,27 @@ if __name__ == "__main__":
         help="Only process these dumps (e.g. CC-MAIN-2021-04)",
     )
     cparser.add_argument(
-        "-j",
-        "--num-proc",
+        "--recheck",
+        action="store_true",
+        help="Also process files that were already found to be clean in a previous run",
+    )
+    cparser.add_argument(
+        "--max-parallel-uploads",
+        type=int,
+        default=2,
+        help="Maximum number of files to upload concurrently",
+    )
+    cparser.add_argument(
+        "--max-parallel-downloads",
+        type=int,
+        default=4,
+        help="Maximum number of files to download concurrently",
+    )
+    cparser.add_argument(
+        "--manifest-write-interval",
         type=int,
-        default=None,
-        help="Number of processes to use for multiprocessing (default: None)",
+        default=100,
+        help="Write the manifest of clean files after every this many newly found clean files",
     )
 
     cli_kwargs = vars(cparser.parse_args())
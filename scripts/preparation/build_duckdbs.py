@@ -1,142 +1,210 @@
 import os
+import random
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from shutil import rmtree
 from time import sleep
-from typing import Callable, Literal
+from typing import Literal
 
 import duckdb
-from datasets import (
-    DatasetDict,
-    IterableDatasetDict,
-    concatenate_datasets,
-    get_dataset_config_names,
-    load_dataset,
-)
-from huggingface_hub import list_repo_files, upload_file
-from huggingface_hub.errors import HfHubHTTPError
+import pyarrow as pa
+import pyarrow.parquet as pq
+from datasets import get_dataset_config_names
+from huggingface_hub import CommitOperationAdd, HfFileSystem, create_commit, list_repo_files, preupload_lfs_files
 from huggingface_hub.hf_api import create_repo, repo_exists
 
-from c5.utils import extract_uuid
+from c5.data_utils import extract_uuids
+from c5.utils import get_available_cpus
+
+
+def sleep_with_backoff(attempt: int, base_seconds: float = 10.0):
+    """
+    Sleep before retrying a failed attempt. The waiting time grows exponentially with the attempt number
+    (1-based), plus some random jitter so that concurrent jobs do not retry at the same time.
+    """
+    sleep(base_seconds * 2 ** (attempt - 1) + random.uniform(0, base_seconds))
+
+
+def remove_duckdb_files(duckdb_path: str):
+    """Remove a DuckDB file and its write-ahead log, if they exist."""
+    for pf in (duckdb_path, f"{duckdb_path}.wal"):
+        if os.path.isfile(pf):
+            os.remove(pf)
 
 
 def dataset_to_duckdb(
     dataset_name: str,
     duckdb_path: str,
-    id_prep_func: Callable = None,
+    extract_uuid: bool = False,
     dataset_config: str | None = None,
-    cache_dir: str | None = None,
-    clear_cache_dir: bool = True,
     overwrite: bool = False,
     num_loaders: int | None = None,
-    num_workers: int | None = None,
 ) -> bool:
     """
-    Load a HuggingFace dataset and save one of its columns as a parquet file so that we can use it to
-    build a DuckDB database from.
+    Read the ID column (and for FineWeb-2 the dump column) of a HuggingFace dataset and build a DuckDB
+    database from them. Only these columns are read from the parquet files on the hub, so the (large)
+    text columns are never downloaded. The database is built in a temporary file that is only moved to
+    duckdb_path once it is complete.
 
     Args:
         dataset_name: The name of the dataset
         duckdb_path: The path to save the duckdb file to
-        unique_column_func: A function to apply to each sample to add the unique column, or the name of the unique column
-        dataset_config: The configuration of the dataset
-        overwrite: Whether to overwrite the parquet file if it already exists
-        num_loaders: The number of parallel loaders to use.
-        num_workers: The number of parallel workers to use when applying the unique_column_func if it is a Callable
-        only_load_columns: The columns to load from the dataset. Can improve the download time by only downloading these columns
+        extract_uuid: Whether to extract the UUID from the `id` column (e.g. for FineWeb's `<urn:uuid:...>` IDs)
+        dataset_config: The configuration of the dataset, which corresponds to a directory in `data/` in the repo
+        overwrite: Whether to overwrite the DuckDB file if it already exists
+        num_loaders: The number of parquet files to read in parallel.
 
     Returns:
         Whether the DuckDB file was successfully built
     """
     if os.path.isfile(duckdb_path) and os.path.getsize(duckdb_path) > 0:
         if overwrite:
-            os.remove(duckdb_path)
+            remove_duckdb_files(duckdb_path)
         else:
             print(f"DuckDB file already exists at {duckdb_path}. Skipping...")
             return duckdb_path
     else:
         os.makedirs(os.path.dirname(duckdb_path), exist_ok=True)
 
-    kwargs = {
-        "path": dataset_name,
-        "name": dataset_config,
-        "num_proc": num_loaders,
-        "cache_dir": cache_dir,
-    }
     print(f"Starting to build DuckDB file at {duckdb_path}")
 
-    while num_retries := 3:
+    fs = HfFileSystem()
+    num_retries = 3
+    while num_retries:
         try:
-            ds = load_dataset(**kwargs, columns=["dump", "id"])
-        except (TypeError, ValueError):
+            # Includes all splits, e.g. data/{config}/train/*.parquet and data/{config}/test/*.parquet
+            parquet_files = sorted(fs.glob(f"datasets/{dataset_name}/data/{dataset_config}/**/*.parquet"))
+            if not parquet_files:
+                raise FileNotFoundError(f"No parquet files found for config {dataset_config}")
+        except Exception as exc:
+            num_retries -= 1
+            if num_retries == 0:
+                raise Exception(
+                    f"Failed to load dataset {dataset_name} with config {dataset_config}."
+                    " Maybe the config (crawl) is too recent and does not actually exist in this repo?"
+                ) from exc
+            else:
+                sleep_with_backoff(3 - num_retries)
+        else:
+            break
+
+    # Because we create one duckdb per FineWeb dump, we only need the dump column for FineWeb-2
+    columns = ["dump", "id"] if dataset_name == "HuggingFaceFW/fineweb-2" else ["id"]
+    schema = pa.schema([(column, pa.string()) for column in columns])
+
+    def read_columns(parquet_file: str) -> pa.Table:
+        # Retry every file separately so that a single transient HTTP error does not abort the whole build
+        num_retries = 3
+        while num_retries:
             try:
-                ds = load_dataset(**kwargs)
+                table = pq.read_table(parquet_file, columns=columns, filesystem=fs)
             except Exception as exc:
                 num_retries -= 1
                 if num_retries == 0:
-                    raise Exception(
-                        f"Failed to load dataset {dataset_name} with config {dataset_config}."
-                        " Maybe the config (crawl) is too recent and does not actually exist in this repo?"
-                    ) from exc
+                    raise Exception(f"Failed to read {parquet_file}") from exc
                 else:
-                    sleep(60 / num_retries)
+                    sleep_with_backoff(3 - num_retries)
             else:
                 break
-        else:
-            break
-
-    if isinstance(ds, DatasetDict) or isinstance(ds, IterableDatasetDict):
-        ds = concatenate_datasets([ds[split] for split in list(ds.keys())])
-
-    ds = ds.remove_columns([c for c in ds.column_names if c not in ("dump", "id")])
-
-    if id_prep_func:
-        ds = ds.map(lambda sample: {"id": id_prep_func(sample)}, num_proc=num_workers)
-
-    farrow = str(Path(duckdb_path).with_suffix(".parquet").resolve())
-    ds.to_parquet(farrow)
-    del ds
-
-    con = duckdb.connect(duckdb_path)
-    if dataset_name == "HuggingFaceFW/fineweb-2":
-        # Create table with two columns: dump and id, and add a primary key on the composite
-        con.execute(f"""
-            CREATE OR REPLACE TABLE data (
-                dump STRING,
-                id UUID,
-                PRIMARY KEY (dump, id)
-            );
-            INSERT INTO data
-                SELECT DISTINCT dump, id FROM '{farrow}';
-            """)
-    else:
-        # Because we create one duckdb for each dump, we don't need the dump column in the table
-        # Create table with one column: id, and add a primary key on it
-        con.execute(f"""
-            CREATE OR REPLACE TABLE data (
-                id UUID PRIMARY KEY
-            );
-            INSERT INTO data
-                SELECT DISTINCT id FROM '{farrow}';
-            """)
-
-    row_count = con.execute("SELECT COUNT(*) FROM data").fetchone()[0]
-    if row_count == 0:
-        raise ValueError(f"No rows were inserted into the DuckDB database at {duckdb_path}")
 
-    print(f"The table in {farrow} has {row_count:,} rows.")
+        if extract_uuid:
+            # Compatible with the DuckDB UUID type
+            table = table.set_column(table.schema.get_field_index("id"), "id", extract_uuids(table["id"]))
+        return table.cast(schema)
+
+    def yield_batches(executor: ThreadPoolExecutor, max_in_flight: int):
+        # Keep a bounded number of files in flight so that reading runs ahead of DuckDB without
+        # accumulating the whole dataset in memory
+        futures = deque()
+        for parquet_file in parquet_files:
+            futures.append(executor.submit(read_columns, parquet_file))
+            if len(futures) >= max_in_flight:
+                yield from futures.popleft().result().to_batches()
+        while futures:
+            yield from futures.popleft().result().to_batches()
+
+    # Build into a temporary file that only replaces duckdb_path once it is complete, so that a failed or
+    # interrupted build never leaves a DuckDB file behind that a next run would consider done
+    tmp_duckdb_path = f"{duckdb_path}.tmp"
+    remove_duckdb_files(tmp_duckdb_path)
+
+    con = duckdb.connect(tmp_duckdb_path)
+    try:
+        num_loaders = num_loaders or min(32, get_available_cpus() + 4)
+        with ThreadPoolExecutor(max_workers=num_loaders) as executor:
+            # Stream the Arrow batches straight into DuckDB rather than writing them to an intermediate file first
+            staging = pa.RecordBatchReader.from_batches(schema, yield_batches(executor, max_in_flight=2 * num_loaders))
+            con.register("staging", staging)
+            # Deduplicate in a single hash aggregate while bulk-loading the table, and only build the unique index
+            # afterwards. Inserting into a table with a primary key would check uniqueness a second time, row by row
+            if dataset_name == "HuggingFaceFW/fineweb-2":
+                # Create table with two columns: dump and id, with a unique index on the composite
+                con.execute("""
+                    CREATE OR REPLACE TABLE data AS
+                        SELECT DISTINCT dump::STRING AS dump, id::UUID AS id FROM staging;
+                    CREATE UNIQUE INDEX data_dump_id_idx ON data (dump, id);
+                    """)
+            else:
+                # Because we create one duckdb for each dump, we don't need the dump column in the table
+                # Create table with one column: id, with a unique index on it
+                con.execute("""
+                    CREATE OR REPLACE TABLE data AS
+                        SELECT DISTINCT id::UUID AS id FROM staging;
+                    CREATE UNIQUE INDEX data_id_idx ON data (id);
+                    """)
+            con.unregister("staging")
+
+        row_count = con.execute("SELECT COUNT(*) FROM data").fetchone()[0]
+        if row_count == 0:
+            raise ValueError(f"No rows were inserted into the DuckDB database at {duckdb_path}")
+    except BaseException:
+        con.close()
+        remove_duckdb_files(tmp_duckdb_path)
+        raise
+
+    con.close()
+    os.replace(tmp_duckdb_path, duckdb_path)
+    print(f"The table in {duckdb_path} has {row_count:,} rows.")
 
-    os.remove(farrow)
+    return True
 
-    if cache_dir and clear_cache_dir:
-        rmtree(cache_dir)
 
-    return True
+def upload_duckdbs(repo_id: str, uploads: list[tuple[str, str, bool]]):
+    """
+    Upload a batch of DuckDB files to the hub in a single commit.
 
+    Args:
+        repo_id: The dataset repository to upload to
+        uploads: A list of (local_duckdb_path, path_in_repo, keep_local) tuples. Local files that do not need to
+        be kept are removed after a successful commit
+    """
+    print(f"Uploading {', '.join(local_duckdb_path for local_duckdb_path, _, _ in uploads)}")
+    num_retries = 3
+    while num_retries:
+        operations = [
+            CommitOperationAdd(path_in_repo=path_in_repo, path_or_fileobj=local_duckdb_path)
+            for local_duckdb_path, path_in_repo, _ in uploads
+        ]
+        try:
+            preupload_lfs_files(repo_id, additions=operations, repo_type="dataset")
+            create_commit(
+                repo_id,
+                operations=operations,
+                commit_message=f"Upload {', '.join(path_in_repo for _, path_in_repo, _ in uploads)}",
+                repo_type="dataset",
+            )
+        except Exception as exc:
+            num_retries -= 1
+            if num_retries == 0:
+                raise exc
+            else:
+                sleep_with_backoff(3 - num_retries)
+        else:
+            break
 
-def fw_prep_func(sample: dict):
-    # "<urn:uuid:6a8657b3-84d0-45df-b4b2-5fb6eef55ee5>" -> "6a8657b384d045dfb4b25fb6eef55ee5"
-    # = compatible with duckdb UUID type
-    return extract_uuid(sample["id"])
+    for local_duckdb_path, _, keep_local in uploads:
+        if not keep_local:
+            os.remove(local_duckdb_path)
 
 
 KEEP_LOCAL = [
@@ -155,13 +223,12 @@ def build_fw2_dbs(
     skip_cfgs: list[str] = None,
     portion: Literal["all", "kept", "removed"] = "kept",
     priority_cfgs: list[str] = None,
+    upload_batch_size: int = 1,
 ):
     skip_cfgs = skip_cfgs or []
     dataset_name = "HuggingFaceFW/fineweb-2"
     config_names = []
 
-    fw2_tmp_dir = Path(__file__).parents[2] / "tmp" / "fineweb-2"
-    fw2_tmp_dir.mkdir(parents=True, exist_ok=True)
     local_duckdb_root = Path(__file__).parents[2] / "duckdbs" / "fineweb-2"
     local_duckdb_root.mkdir(parents=True, exist_ok=True)
 
@@ -185,60 +252,60 @@ def build_fw2_dbs(
 
     existing_files_in_repo = list_repo_files(repo_id="BramVanroy/fineweb-2-duckdbs", repo_type="dataset")
 
-    config_success = {}
-    for cfg_name in config_names:
-        if cfg_name in skip_cfgs:
-            print(f"Skipping {cfg_name} because it is in skip_cfgs")
-            continue
-
-        local_duckdb_path = str(local_duckdb_root / f"fw2-{cfg_name}.duckdb")
-        path_in_repo = Path(local_duckdb_path).name
-        exists_in_repo = path_in_repo in existing_files_in_repo
-
-        if overwrite or (not os.path.isfile(local_duckdb_path) and not exists_in_repo):
-            print(f"Buidling DuckDB for {cfg_name}")
-            lang_success = dataset_to_duckdb(
-                "HuggingFaceFW/fineweb-2",
-                local_duckdb_path,
-                # For fineweb we still have to extract the UUID from the `id` column
-                id_prep_func=fw_prep_func,
-                dataset_config=cfg_name,
-                overwrite=False,
-                num_loaders=None,
-                num_workers=64,
-                cache_dir=str(fw2_tmp_dir / cfg_name),
-                clear_cache_dir=True,
-            )
-            config_success[cfg_name] = lang_success
-        else:
-            print(
-                f"Skipping processing {cfg_name} because the DuckDB file already exists either locally or in the remote repo"
+    # Upload in the background so that the next DuckDBs can already be built in the meantime
+    with ThreadPoolExecutor(max_workers=1) as upload_executor:
+        upload_futures = []
+        pending_uploads = []
+
+        config_success = {}
+        for cfg_name in config_names:
+            if cfg_name in skip_cfgs:
+                print(f"Skipping {cfg_name} because it is in skip_cfgs")
+                continue
+
+            local_duckdb_path = str(local_duckdb_root / f"fw2-{cfg_name}.duckdb")
+            path_in_repo = Path(local_duckdb_path).name
+            exists_in_repo = path_in_repo in existing_files_in_repo
+
+            if overwrite or (not os.path.isfile(local_duckdb_path) and not exists_in_repo):
+                print(f"Buidling DuckDB for {cfg_name}")
+                lang_success = dataset_to_duckdb(
+                    "HuggingFaceFW/fineweb-2",
+                    local_duckdb_path,
+                    # For fineweb we still have to extract the UUID from the `id` column
+                    extract_uuid=True,
+                    dataset_config=cfg_name,
+                    overwrite=False,
+                    num_loaders=16,
+                )
+                config_success[cfg_name] = lang_success
+            else:
+                print(
+                    f"Skipping processing {cfg_name} because the DuckDB file already exists either locally or in the remote repo"
+                )
+                config_success[cfg_name] = True
+
+            if os.path.isfile(local_duckdb_path) and (overwrite or not exists_in_repo):
+                keep_local = any(cfg_name.startswith(lang) for lang in KEEP_LOCAL)
+                pending_uploads.append((local_duckdb_path, path_in_repo, keep_local))
+
+            if len(pending_uploads) >= upload_batch_size:
+                # Only have one batch in flight while the next batch is being built. So up to twice the batch size of
+                # (multi-GB) DuckDB files are on local disk at the same time
+                for future in upload_futures:
+                    future.result()
+                upload_futures = [
+                    upload_executor.submit(upload_duckdbs, "BramVanroy/fineweb-2-duckdbs", pending_uploads)
+                ]
+                pending_uploads = []
+
+        if pending_uploads:
+            upload_futures.append(
+                upload_executor.submit(upload_duckdbs, "BramVanroy/fineweb-2-duckdbs", pending_uploads)
             )
-            config_success[cfg_name] = True
-
-        if os.path.isfile(local_duckdb_path) and (overwrite or not exists_in_repo):
-            print(f"Uploading {local_duckdb_path}")
-            while num_retries := 3:
-                try:
-                    upload_file(
-                        path_or_fileobj=local_duckdb_path,
-                        path_in_repo=path_in_repo,
-                        repo_id="BramVanroy/fineweb-2-duckdbs",
-                        repo_type="dataset",
-                    )
-                except Exception as exc:
-                    num_retries -= 1
-                    if num_retries == 0:
-                        raise exc
-                    else:
-                        sleep(60 / num_retries)
-                else:
-                    break
 
-            if not any(cfg_name.startswith(lang) for lang in KEEP_LOCAL):
-                os.remove(local_duckdb_path)
-
-            sleep(30)
+        for future in upload_futures:
+            future.result()
 
     failed_cfgs = {cfg_name for cfg_name, success in config_success.items() if not success}
 
@@ -248,7 +315,12 @@ def build_fw2_dbs(
             print(f"- {cfg}")
 
 
-def build_fw_dbs(overwrite: bool = False, skip_dumps: list[str] = None, priority_dumps: list[str] = None):
+def build_fw_dbs(
+    overwrite: bool = False,
+    skip_dumps: list[str] = None,
+    priority_dumps: list[str] = None,
+    upload_batch_size: int = 1,
+):
     skip_dumps = skip_dumps or []
     dataset_name = "HuggingFaceFW/fineweb"
     dump_names = [cfg for cfg in get_dataset_config_names(dataset_name) if cfg.startswith("CC-MAIN")]
@@ -257,8 +329,6 @@ def build_fw_dbs(overwrite: bool = False, skip_dumps: list[str] = None, priority
         priority_dumps = [d for d in priority_dumps if d in dump_names]
         dump_names = priority_dumps + [d for d in dump_names if d not in priority_dumps]
 
-    fw_tmp_dir = Path(__file__).parents[2] / "tmp" / "fineweb"
-    fw_tmp_dir.mkdir(parents=True, exist_ok=True)
     local_duckdb_root = Path(__file__).parents[2] / "duckdbs" / "fineweb"
     local_duckdb_root.mkdir(parents=True, exist_ok=True)
 
@@ -270,60 +340,59 @@ def build_fw_dbs(overwrite: bool = False, skip_dumps: list[str] = None, priority
 
     existing_files_in_repo = list_repo_files(repo_id="BramVanroy/fineweb-duckdbs", repo_type="dataset")
 
-    dump_success_result = {}
-    for dump in dump_names:
-        if dump in skip_dumps:
-            print(f"Skipping {dump} because it is in skip_dumps")
-            continue
-
-        local_duckdb_path = str(local_duckdb_root / f"fw-{dump}.duckdb")
-        path_in_repo = Path(local_duckdb_path).name
-        exists_in_repo = path_in_repo in existing_files_in_repo
-
-        if overwrite or (not os.path.isfile(local_duckdb_path) and not exists_in_repo):
-            print(f"Buidling DuckDB for {dump}")
-            dump_success = dataset_to_duckdb(
-                "HuggingFaceFW/fineweb",
-                local_duckdb_path,
-                id_prep_func=fw_prep_func,
-                dataset_config=dump,
-                overwrite=False,
-                num_loaders=None,
-                num_workers=64,
-                cache_dir=str(fw_tmp_dir / dump),
-                clear_cache_dir=True,
-            )
-            dump_success_result[dump] = dump_success
-        else:
-            print(
-                f"Skipping processing {dump} because the DuckDB file already exists either locally or in the remote repo"
+    # Upload in the background so that the next DuckDBs can already be built in the meantime
+    with ThreadPoolExecutor(max_workers=1) as upload_executor:
+        upload_futures = []
+        pending_uploads = []
+
+        dump_success_result = {}
+        for dump in dump_names:
+            if dump in skip_dumps:
+                print(f"Skipping {dump} because it is in skip_dumps")
+                continue
+
+            local_duckdb_path = str(local_duckdb_root / f"fw-{dump}.duckdb")
+            path_in_repo = Path(local_duckdb_path).name
+            exists_in_repo = path_in_repo in existing_files_in_repo
+
+            if overwrite or (not os.path.isfile(local_duckdb_path) and not exists_in_repo):
+                print(f"Buidling DuckDB for {dump}")
+                dump_success = dataset_to_duckdb(
+                    "HuggingFaceFW/fineweb",
+                    local_duckdb_path,
+                    extract_uuid=True,
+                    dataset_config=dump,
+                    overwrite=False,
+                    num_loaders=16,
+                )
+                dump_success_result[dump] = dump_success
+            else:
+                print(
+                    f"Skipping processing {dump} because the DuckDB file already exists either locally or in the remote repo"
+                )
+                dump_success_result[dump] = True
+
+            if os.path.isfile(local_duckdb_path) and (overwrite or not exists_in_repo):
+                keep_local = dump in KEEP_LOCAL
+                pending_uploads.append((local_duckdb_path, path_in_repo, keep_local))
+
+            if len(pending_uploads) >= upload_batch_size:
+                # Only have one batch in flight while the next batch is being built. So up to twice the batch size of
+                # (multi-GB) DuckDB files are on local disk at the same time
+                for future in upload_futures:
+                    future.result()
+                upload_futures = [
+                    upload_executor.submit(upload_duckdbs, "BramVanroy/fineweb-duckdbs", pending_uploads)
+                ]
+                pending_uploads = []
+
+        if pending_uploads:
+            upload_futures.append(
+                upload_executor.submit(upload_duckdbs, "BramVanroy/fineweb-duckdbs", pending_uploads)
             )
-            dump_success_result[dump] = True
-
-        if os.path.isfile(local_duckdb_path) and (overwrite or not exists_in_repo):
-            print(f"Uploading {local_duckdb_path}")
-            num_retries = 3
-            while num_retries:
-                try:
-                    upload_file(
-                        path_or_fileobj=local_duckdb_path,
-                        path_in_repo=path_in_repo,
-                        repo_id="BramVanroy/fineweb-duckdbs",
-                        repo_type="dataset",
-                    )
-                except HfHubHTTPError as exc:
-                    num_retries -= 1
-                    if num_retries == 0:
-                        raise exc
-                    else:
-                        sleep(60 / num_retries)
-                else:
-                    break
-
-            if dump not in KEEP_LOCAL:
-                os.remove(local_duckdb_path)
 
-            sleep(30)
+        for future in upload_futures:
+            future.result()
 
     print("Failed languages:")
     for dump, success in dump_success_result.items():
@@ -336,10 +405,17 @@ if __name__ == "__main__":
 
     parser = argparse.ArgumentParser(description="Build DuckDBs for the fineweb datasets")
     parser.add_argument("--fw-version", choices=["fineweb-2", "fineweb"], required=True)
+    parser.add_argument(
+        "--upload-batch-size",
+        type=int,
+        default=1,
+        help="Number of DuckDB files to upload together in a single commit. Because one batch is uploaded while the"
+        " next one is built, up to twice this many (multi-GB) DuckDB files are kept on local disk at the same time",
+    )
     cargs = parser.parse_args()
     if cargs.fw_version == "fineweb-2":
         fw2_priority_cfgs = [f"{c}_removed" for c in KEEP_LOCAL] + KEEP_LOCAL
-        build_fw2_dbs(portion="all", priority_cfgs=fw2_priority_cfgs)
+        build_fw2_dbs(portion="all", priority_cfgs=fw2_priority_cfgs, upload_batch_size=cargs.upload_batch_size)
     elif cargs.fw_version == "fineweb":
         build_fw_dbs(
             priority_dumps=[
@@ -352,6 +428,7 @@ if __name__ == "__main__":
                 "CC-MAIN-2025-05",
                 "CC-MAIN-2024-46",
             ],
+            upload_batch_size=cargs.upload_batch_size,
         )
     else:
         raise ValueError(f"Unknown fineweb version: {cargs.fw_version}")
@@ -1,6 +1,7 @@
 import json
 
 import requests
+from requests.adapters import HTTPAdapter
 
 
 repo_id = "BramVanroy/fineweb-2-duckdbs"
@@ -8,13 +9,15 @@ api_url = f"https://huggingface.co/api/datasets/{repo_id}?blobs=true"
 request_timeout_seconds = 30
 
 
-total_size_bytes = 0
 duckdb_files_info = []
 
 print(f"Fetching file list and sizes from API: {api_url}")
 
 try:
-    response = requests.get(api_url, timeout=request_timeout_seconds)
+    # Reuse the connection (keep-alive) should more requests be made, e.g. for other repos
+    with requests.Session() as session:
+        session.mount("https://", HTTPAdapter(pool_maxsize=32))
+        response = session.get(api_url, timeout=request_timeout_seconds)
     response.raise_for_status()  # Raise an exception for HTTP errors (4xx or 5xx)
 
     repo_data = response.json()
@@ -28,7 +31,6 @@ try:
 
                     if isinstance(file_size, (int, float)) and file_size >= 0:
                         duckdb_files_info.append({"name": file_name, "size": file_size})
-                        total_size_bytes += file_size
                     else:
                         print(f"Warning: Invalid or missing size for {file_name}: {file_size}. Skipping.")
             else:
@@ -50,6 +52,7 @@ except json.JSONDecodeError:
 except Exception as e:
     print(f"An unexpected error occurred: {e}")
 
+total_size_bytes = sum(f_info["size"] for f_info in duckdb_files_info)
 
 print("\n--- Summary ---")
 if duckdb_files_info:
@@ -1,16 +1,21 @@
-from pathlib import Path
+import importlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import suppress
 
-import yaml
 from datatrove.executor.local import LocalPipelineExecutor
 
 from c5.script_utils import (
     BaseConfig,
+    RunPaths,
     build_containment_pipeline,
     build_main_pipeline,
     download_duckdbs,
+    get_effective_num_tasks,
     get_fw_c_and_d_domains,
+    load_config,
 )
-from c5.utils import PROJECT_ROOT
+from c5.utils import get_available_cpus
 
 
 def main(
@@ -18,21 +23,24 @@ def main(
     output_path: str,
     pipelines_config: str,
 ):
-    if pipelines_config and Path(pipelines_config).is_file():
-        config = yaml.safe_load(Path(pipelines_config).read_text(encoding="utf-8"))
-    else:
-        raise FileNotFoundError("pipelines_config file not found")
-
-    cfg = BaseConfig(**config)
+    cfg = load_config(pipelines_config, BaseConfig)
 
     fw_duckdb_path = cfg.fw_duckdb_templ_path.format(dump=dump)
-    ignore_duckdb_for, _ = download_duckdbs(dump, fw_duckdb_path, cfg)
+    ignore_duckdb_for, ignore_all_duckdb = download_duckdbs(
+        dump, fw_duckdb_path, cfg, max_parallel_downloads=cfg.duckdb_download_workers
+    )
+
+    paths = RunPaths.from_output_path(output_path, dump)
+    # If none of the languages are in the databases, the main pipeline writes the final output itself and the
+    # containment pipelines are not needed. Unless the main pipeline already wrote output for them before
+    skip_containment = ignore_all_duckdb
+    if skip_containment and paths.has_intermediate_main_output():
+        print(f"Running the containment pipelines for the existing output in {paths.main_output_dir}")
+        skip_containment = False
 
-    main_output_path = output_path.rstrip("/") + "-main/"
-    main_dump_output_path = main_output_path + dump + "/"
     main_pipeline = build_main_pipeline(
         dump=dump,
-        output_folder=main_dump_output_path,
+        output_folder=paths.main_output_dir,
         languages=cfg.languages,
         ignore_undetermined=cfg.ignore_undetermined,
         limit=cfg.limit,
@@ -42,18 +50,32 @@ def main(
         max_num_retries=cfg.max_num_retries,
         timeout_s=cfg.timeout_s,
         contact_email=cfg.contact_email,
+        use_fastwarc=cfg.use_fastwarc,
+        trafilatura_no_fallback=cfg.trafilatura_no_fallback,
+        final_output_folder=paths.containment_output_dir if skip_containment else None,
     )
+    # Run at most one worker per available CPU rather than all tasks at once
+    main_workers = cfg.main_workers if cfg.main_workers > 0 else get_available_cpus()
     main_executor = LocalPipelineExecutor(
         pipeline=main_pipeline,
-        tasks=cfg.main_tasks,
-        workers=cfg.main_workers,
-        logging_dir=str(PROJECT_ROOT / "logs" / "main-logs" / dump),
+        tasks=get_effective_num_tasks(dump, cfg.main_tasks, main_workers, logging_dir=paths.main_logs_dir),
+        workers=main_workers,
+        logging_dir=paths.main_logs_dir,
         randomize_start_duration=cfg.randomize_start_duration,
+        # Fork rather than start a fresh interpreter per worker, so that the modules preloaded below are inherited
+        start_method="fork",
     )
 
     # Do containment checking (separately because it's intensive on storage)
-    containment_dump_output_path = output_path.rstrip("/") + "/" + dump + "/"
-    for language in cfg.languages:
+    # The languages' containment pipelines run concurrently, so divide the CPUs over them. With more languages
+    # than CPUs, every pipeline gets one worker and at most one pipeline per CPU runs at a time (see below)
+    num_cpus = get_available_cpus()
+    containment_workers = cfg.containment_workers if cfg.containment_workers > 0 else cfg.containment_tasks
+    containment_workers = max(1, min(containment_workers, num_cpus // len(cfg.languages)))
+    # Not needed at all if the main pipeline already wrote the final output
+    containment_languages = [] if skip_containment else cfg.languages
+    containment_executors = []
+    for language in containment_languages:
         is_fw2 = language != "eng_Latn"
         ignore_duckdb = language in ignore_duckdb_for
 
@@ -63,21 +85,41 @@ def main(
             duckdb_path = cfg.fw_duckdb_templ_path.format(dump=dump)
 
         containment_pipeline = build_containment_pipeline(
-            input_path=main_dump_output_path + language + "/",
+            input_path=paths.containment_input_dir(language),
             duckdb_path=duckdb_path,
             is_fw2=is_fw2,
             overwrite_with_none=ignore_duckdb,
-            output_folder=containment_dump_output_path,
+            output_folder=paths.containment_output_dir,
+            # Every worker has its own CPU, so do not let DuckDB start a thread per core in each of them
+            duckdb_threads=1,
         )
         containment_executor = LocalPipelineExecutor(
             pipeline=containment_pipeline,
             tasks=cfg.containment_tasks,
-            workers=cfg.containment_workers,
-            logging_dir=str(PROJECT_ROOT / "logs" / "containment-logs" / dump / language),
+            workers=containment_workers,
+            logging_dir=os.path.join(paths.containment_logs_dir, language),
             depends=main_executor,
         )
+        containment_executors.append(containment_executor)
+
+    # Import the heavy dependencies of the main pipeline once, so that the forked workers share them
+    # (copy-on-write) instead of importing them again in every task
+    for module_name in ("trafilatura", "lxml.html", "fasttext"):
+        with suppress(ImportError):
+            importlib.import_module(module_name)
+
+    # Run the shared dependency once up front, so that the concurrent containment executors do not all try to
+    # launch it themselves. This happens before any threads are started, so forking its workers is safe
+    main_executor.run()
+
+    if not containment_executors:
+        return
 
-        containment_executor.run()
+    # Each language queries its own database, so the pipelines are independent of each other
+    with ThreadPoolExecutor(max_workers=min(len(containment_executors), num_cpus)) as executor:
+        futures = [executor.submit(containment_executor.run) for containment_executor in containment_executors]
+        for future in futures:
+            future.result()
 
 
 if __name__ == "__main__":
@@ -1,17 +1,18 @@
-from pathlib import Path
-
-import yaml
+import os
+from concurrent.futures import ThreadPoolExecutor
 
 from c5.components.slurm_executor import C5SlurmExecutor
 from c5.script_utils import (
+    RunPaths,
     SlurmConfig,
     build_containment_pipeline,
     build_main_pipeline,
     download_duckdbs,
     get_fw_c_and_d_domains,
     job_id_retriever,
+    load_config,
 )
-from c5.utils import PROJECT_ROOT, print_system_stats
+from c5.utils import print_system_stats
 
 
 def main(
@@ -23,18 +24,25 @@ def main(
     account: str | None = None,
 ):
     print_system_stats()
-    config = yaml.safe_load(Path(pipelines_config).read_text(encoding="utf-8"))
+    cfg = load_config(pipelines_config, SlurmConfig)
     sbatch_args = {"account": account} if account else {}
-    cfg = SlurmConfig(**config)
 
     fw_duckdb_path = cfg.fw_duckdb_templ_path.format(dump=dump)
-    ignore_duckdb_for, _ = download_duckdbs(dump, fw_duckdb_path, cfg)
+    ignore_duckdb_for, ignore_all_duckdb = download_duckdbs(
+        dump, fw_duckdb_path, cfg, max_parallel_downloads=cfg.duckdb_download_workers
+    )
+
+    paths = RunPaths.from_output_path(output_path, dump)
+    # If none of the languages are in the databases, the main pipeline writes the final output itself and the
+    # containment pipelines are not needed. Unless the main pipeline already wrote output for them before
+    skip_containment = ignore_all_duckdb
+    if skip_containment and paths.has_intermediate_main_output():
+        print(f"Running the containment pipelines for the existing output in {paths.main_output_dir}")
+        skip_containment = False
 
-    main_output_path = output_path.rstrip("/") + "-main/"
-    main_dump_output_path = main_output_path + dump + "/"
     main_pipeline = build_main_pipeline(
         dump=dump,
-        output_folder=main_dump_output_path,
+        output_folder=paths.main_output_dir,
         languages=cfg.languages,
         ignore_undetermined=cfg.ignore_undetermined,
         limit=cfg.limit,
@@ -44,6 +52,9 @@ def main(
         max_num_retries=cfg.max_num_retries,
         timeout_s=cfg.timeout_s,
         contact_email=cfg.contact_email,
+        use_fastwarc=cfg.use_fastwarc,
+        trafilatura_no_fallback=cfg.trafilatura_no_fallback,
+        final_output_folder=paths.containment_output_dir if skip_containment else None,
     )
     main_executor = C5SlurmExecutor(
         pipeline=main_pipeline,
@@ -51,15 +62,16 @@ def main(
         tasks=cfg.main_tasks,
         workers=cfg.main_workers,
         time=cfg.main_time,
-        logging_dir=str(PROJECT_ROOT / "logs" / "main-logs" / dump),
-        slurm_logs_folder=str(PROJECT_ROOT / "slurm-logs" / "main-logs" / dump),
+        logging_dir=paths.main_logs_dir,
+        slurm_logs_folder=paths.main_slurm_logs_dir,
         randomize_start_duration=cfg.randomize_start_duration,
         mem_per_cpu_gb=cfg.main_mem_per_cpu_gb,
         cpus_per_task=cfg.main_cpus_per_task,
         partition=partition,
         venv_path=venv_path,
         qos="",
-        sbatch_args=sbatch_args,
+        # Every executor gets its own copy, so that changes made by one executor do not leak into the others
+        sbatch_args=dict(sbatch_args),
         job_name="process-main",
         max_array_launch_parallel=cfg.main_max_array_launch_parallel,
         stagger_max_array_jobs=cfg.main_stagger_max_array_jobs,
@@ -67,8 +79,24 @@ def main(
     )
 
     # Do containment checking (separately because it's intensive on storage)
-    containment_dump_output_path = output_path.rstrip("/") + "/" + dump + "/"
-    for language in cfg.languages:
+    # Settings that are the same for all languages
+    containment_executor_kwargs = {
+        "job_id_retriever": job_id_retriever,
+        "tasks": cfg.containment_tasks,
+        "workers": cfg.containment_workers,
+        "time": cfg.containment_time,
+        "mem_per_cpu_gb": cfg.containment_mem_per_cpu_gb,
+        "cpus_per_task": cfg.containment_cpus_per_task,
+        "partition": partition,
+        "venv_path": venv_path,
+        "qos": "",
+        "job_name": "process-containment",
+        "depends": main_executor,
+    }
+    # Not needed at all if the main pipeline already wrote the final output
+    containment_languages = [] if skip_containment else cfg.languages
+    containment_executors = []
+    for language in containment_languages:
         is_fw2 = language != "eng_Latn"
         ignore_duckdb = language in ignore_duckdb_for
 
@@ -78,31 +106,33 @@ def main(
             duckdb_path = cfg.fw_duckdb_templ_path.format(dump=dump)
 
         containment_pipeline = build_containment_pipeline(
-            input_path=main_dump_output_path + language + "/",
+            input_path=paths.containment_input_dir(language),
             duckdb_path=duckdb_path,
             is_fw2=is_fw2,
             overwrite_with_none=ignore_duckdb,
-            output_folder=containment_dump_output_path,
+            output_folder=paths.containment_output_dir,
         )
         containment_executor = C5SlurmExecutor(
             pipeline=containment_pipeline,
-            job_id_retriever=job_id_retriever,
-            tasks=cfg.containment_tasks,
-            workers=cfg.containment_workers,
-            time=cfg.containment_time,
-            logging_dir=str(PROJECT_ROOT / "logs" / "containment-logs" / dump / language),
-            slurm_logs_folder=str(PROJECT_ROOT / "slurm-logs" / "containment-logs" / dump / language),
-            mem_per_cpu_gb=cfg.containment_mem_per_cpu_gb,
-            cpus_per_task=cfg.containment_cpus_per_task,
-            partition=partition,
-            venv_path=venv_path,
-            qos="",
-            sbatch_args=sbatch_args,
-            job_name="process-containment",
-            depends=main_executor,
+            logging_dir=os.path.join(paths.containment_logs_dir, language),
+            slurm_logs_folder=os.path.join(paths.containment_slurm_logs_dir, language),
+            sbatch_args=dict(sbatch_args),
+            **containment_executor_kwargs,
         )
+        containment_executors.append(containment_executor)
+
+    # Submit the shared dependency once up front, so that the concurrent submissions below do not all try to
+    # launch it themselves
+    main_executor.run()
+
+    if not containment_executors:
+        return
 
-        containment_executor.run()
+    # Every submission blocks on sbatch, and the languages' jobs are independent of each other
+    with ThreadPoolExecutor(max_workers=min(8, len(containment_executors))) as executor:
+        futures = [executor.submit(containment_executor.run) for containment_executor in containment_executors]
+        for future in futures:
+            future.result()
 
 
 if __name__ == "__main__":
@@ -1,9 +1,8 @@
 from pathlib import Path
 
-import yaml
 from datatrove.executor.local import LocalPipelineExecutor
 
-from c5.script_utils import BaseUploadConfig, build_upload_pipeline
+from c5.script_utils import BaseUploadConfig, build_upload_pipeline, load_config
 from c5.utils import PROJECT_ROOT
 
 
@@ -18,10 +17,9 @@ def main(
 
     crawl_name = Path(output_path).stem
     if pipelines_config and Path(pipelines_config).is_file():
-        config = yaml.safe_load(Path(pipelines_config).read_text(encoding="utf-8"))
+        cfg = load_config(pipelines_config, BaseUploadConfig)
     else:
-        config = {}
-    cfg = BaseUploadConfig(**config)
+        cfg = BaseUploadConfig()
 
     pipeline = build_upload_pipeline(
         jsonl_path=jsonl_path,
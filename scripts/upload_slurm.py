@@ -1,9 +1,7 @@
 from pathlib import Path
 
-import yaml
-
 from c5.components.slurm_executor import C5SlurmExecutor
-from c5.script_utils import SlurmUploadConfig, build_upload_pipeline, job_id_retriever
+from c5.script_utils import SlurmUploadConfig, build_upload_pipeline, job_id_retriever, load_config
 from c5.utils import PROJECT_ROOT, print_system_stats
 
 
@@ -21,9 +19,8 @@ def main(
 
     crawl_name = Path(output_path).stem
     print_system_stats()
-    config = yaml.safe_load(Path(pipelines_config).read_text(encoding="utf-8"))
+    cfg = load_config(pipelines_config, SlurmUploadConfig)
     sbatch_args = {"account": account} if account else {}
-    cfg = SlurmUploadConfig(**config)
 
     pipeline = build_upload_pipeline(
         jsonl_path=jsonl_path,
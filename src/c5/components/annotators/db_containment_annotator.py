@@ -3,7 +3,7 @@ from typing import Iterator
 
 from datatrove.data import Document
 
-from ...utils import extract_uuid
+from ...utils import connect_duckdb, extract_uuid, query_containment
 from .base import BaseBatchAnnotator
 
 
@@ -43,8 +43,6 @@ class FWDBContainmentAnnotator(BaseBatchAnnotator):
                 yield doc
             return
         else:
-            import duckdb
-
             # Group documents by language to avoid re-opening the same database multiple times
             grouped_docs = defaultdict(list)
             for doc in docs:
@@ -67,35 +65,16 @@ class FWDBContainmentAnnotator(BaseBatchAnnotator):
                         duckdb_path = self.fw_duckdb_path
                     else:
                         duckdb_path = self.fw2_duckdb_templ_path.format(language=full_lang)
-                    con = duckdb.connect(duckdb_path, read_only=True)
+                    con = connect_duckdb(duckdb_path)
                     self.cons[full_lang] = con
 
                 con = self.cons[full_lang]
 
                 # Batch query: check multiple UUIDs at once
                 # FineWeb (English) only has the `id` column to test for existence
-                if full_lang == self.fw_eng_tag:
-                    uuids = [extract_uuid(doc.id) for doc in doc_group]
-                    placeholders = ", ".join(["(?)"] * len(uuids))
-                    query = f"""
-                        SELECT CASE WHEN d.id IS NOT NULL THEN 1 ELSE 0 END AS exists
-                        FROM (VALUES {placeholders}) AS v(id)
-                        LEFT JOIN data d
-                        ON v.id = d.id;
-                    """
-                    results = con.execute(query, uuids).fetchall()
-                else:
-                    uuids = [(doc.metadata["dump"], extract_uuid(doc.id)) for doc in doc_group]
-                    placeholders = ", ".join(["(?, ?)"] * len(uuids))
-                    query = f"""
-                        SELECT CASE WHEN d.id IS NOT NULL THEN 1 ELSE 0 END AS exists
-                        FROM (VALUES {placeholders}) AS v(dump, id)
-                        LEFT JOIN data d
-                        ON v.dump = d.dump AND v.id = d.id;
-                    """
-                    results = con.execute(query, [value for pair in uuids for value in pair]).fetchall()
-
-                results = [bool(r[0]) for r in results]
+                uuids = [extract_uuid(doc.id) for doc in doc_group]
+                dumps = None if full_lang == self.fw_eng_tag else [doc.metadata["dump"] for doc in doc_group]
+                results = query_containment(con, uuids, dumps)
 
                 # Update documents with results
                 for doc, exists in zip(doc_group, results):
@@ -3,7 +3,7 @@ from typing import Iterator
 from datatrove.data import Document
 
 from c5.components.annotators.base import BaseBatchAnnotator
-from c5.utils import extract_uuid
+from c5.utils import connect_duckdb, extract_uuid, query_containment
 
 
 class FWSingleDBContainmentAnnotator(BaseBatchAnnotator):
@@ -18,6 +18,7 @@ class FWSingleDBContainmentAnnotator(BaseBatchAnnotator):
         added_key: str,
         batch_size: int = 512,
         overwrite_with_none: bool = False,
+        duckdb_threads: int | None = None,
     ):
         super().__init__(batch_size=batch_size)
 
@@ -27,13 +28,13 @@ class FWSingleDBContainmentAnnotator(BaseBatchAnnotator):
 
         self._con = None
         self.overwrite_with_none = overwrite_with_none
+        # Limit the threads when many annotators query their databases concurrently, e.g. in local runs
+        self.duckdb_threads = duckdb_threads
 
     @property
     def con(self):
         if self._con is None:
-            import duckdb
-
-            self._con = duckdb.connect(self.duckdb_path, read_only=True)
+            self._con = connect_duckdb(self.duckdb_path, threads=self.duckdb_threads)
         return self._con
 
     def annotate(self, docs: list[Document]) -> Iterator[Document]:
@@ -45,28 +46,9 @@ class FWSingleDBContainmentAnnotator(BaseBatchAnnotator):
         else:
             # Batch query: check multiple UUIDs at once
             # FineWeb (English) only has the `id` column to test for existence
-            if not self.is_fw2:
-                uuids = [extract_uuid(doc.id) for doc in docs]
-                placeholders = ", ".join(["(?)"] * len(uuids))
-                query = f"""
-                    SELECT CASE WHEN d.id IS NOT NULL THEN 1 ELSE 0 END AS exists
-                    FROM (VALUES {placeholders}) AS v(id)
-                    LEFT JOIN data d
-                    ON v.id = d.id;
-                """
-                results = self.con.execute(query, uuids).fetchall()
-            else:
-                uuids = [(doc.metadata["dump"], extract_uuid(doc.id)) for doc in docs]
-                placeholders = ", ".join(["(?, ?)"] * len(uuids))
-                query = f"""
-                    SELECT CASE WHEN d.id IS NOT NULL THEN 1 ELSE 0 END AS exists
-                    FROM (VALUES {placeholders}) AS v(dump, id)
-                    LEFT JOIN data d
-                    ON v.dump = d.dump AND v.id = d.id;
-                """
-                results = self.con.execute(query, [value for pair in uuids for value in pair]).fetchall()
-
-            results = [bool(r[0]) for r in results]
+            uuids = [extract_uuid(doc.id) for doc in docs]
+            dumps = [doc.metadata["dump"] for doc in docs] if self.is_fw2 else None
+            results = query_containment(self.con, uuids, dumps)
 
             # Update documents with results
             for doc, exists in zip(docs, results):
@@ -1,2 +1,3 @@
+from c5.components.readers.retry_fastwarc import RetryFastWarcReader
 from c5.components.readers.retry_warc import RetryWarcReader
 from c5.components.readers.robust_jsonl import RobustJsonlReader
@@ -0,0 +1,136 @@
+from typing import Callable, Literal
+
+from datatrove.io import DataFileLike, DataFolderLike
+
+from c5.components.readers.retry_warc import RetryWarcReader
+
+
+def process_fastwarc_record(record) -> dict | None:
+    """Process a FastWARC record to extract the html and metadata (id, url, date). Equivalent to
+    datatrove's `process_record` for warcio records."""
+    import cchardet
+    import magic
+    from fastwarc.warc import WarcRecordType
+
+    is_conversion = record.record_type == WarcRecordType.conversion  # wet files have "conversion" type
+
+    # content type filtering
+    mime_type = record.headers.get("WARC-Identified-Payload-Type", None)
+    if mime_type is not None and (
+        mime_type != "text/html"
+        and mime_type != "application/xhtml+xml"
+        and (not is_conversion or mime_type != "text/plain")
+    ):
+        return None
+
+    content_bytes = record.reader.read()
+    if mime_type is None:
+        # fallback for older crawls without payload types
+        mime_type = magic.from_buffer(content_bytes, mime=True)
+        if mime_type != "text/html" and (not is_conversion or mime_type != "text/plain"):
+            return None
+
+    # Decode the response bytes
+    charset = "UTF-8"
+    try:
+        html = content_bytes.decode(charset)
+    except UnicodeDecodeError:
+        encoding_det = cchardet.detect(content_bytes)["encoding"]
+        if not encoding_det or encoding_det == charset:
+            return None
+        charset = encoding_det
+
+        try:
+            html = content_bytes.decode(charset)
+        except (UnicodeDecodeError, LookupError):
+            return None
+
+    data_id = record.headers.get("WARC-Record-ID", None)
+    url = record.headers.get("WARC-Target-URI", None)
+    date = record.headers.get("WARC-Date", None)
+
+    return {"text": html, "id": data_id, "url": url, "date": date}
+
+
+class RetryFastWarcReader(RetryWarcReader):
+    """Read data from WARC files with FastWARC instead of warcio.
+        Will read each record as a separate document.
+
+        FastWARC parses records and decompresses the (gzip, lz4 or zstd) stream in C++, which makes it
+        considerably faster than warcio. By default the compression is therefore not handled by the data
+        folder (compression=None) but detected by FastWARC itself. Only response and conversion records
+        are parsed.
+
+    Args:
+        data_folder: a str, tuple or DataFolder object representing a path/filesystem
+        paths_file: optionally provide a file with one path per line (without the `data_folder` prefix) to read.
+        compression: the compression to use (default: None, i.e. let FastWARC detect it)
+        limit: limit the number of documents to read. Useful for debugging
+        skip: skip the first n rows
+        file_progress: show progress bar for files
+        doc_progress: show progress bar for documents
+        adapter: function to adapt the data dict from the source to a Document.
+            Takes as input: (self, data: dict, path: str, id_in_file: int | str)
+                self allows access to self.text_key and self.id_key
+            Returns: a dict with at least a "text" and "id" keys
+        text_key: the key containing the text data (default: "text").
+        id_key: the key containing the id for each sample (default: "id").
+        default_metadata: a dictionary with any data that should be added to all samples' metadata
+        recursive: whether to search files recursively. Ignored if paths_file is provided
+        glob_pattern: pattern that all files must match exactly to be included (relative to data_folder). Ignored if paths_file is provided
+        shuffle_files: shuffle the files within the returned shard. Mostly used for data viz. purposes, do not use with dedup blocks
+    """
+
+    name = "🕷 FastWarc"
+    _requires_dependencies = ["fastwarc", ("cchardet", "faust-cchardet"), ("magic", "python-magic")]
+
+    def __init__(
+        self,
+        data_folder: DataFolderLike,
+        paths_file: DataFileLike | None = None,
+        compression: Literal["infer", "gzip", "zstd"] | None = None,
+        limit: int = -1,
+        skip: int = 0,
+        file_progress: bool = False,
+        doc_progress: bool = False,
+        adapter: Callable = None,
+        text_key: str = "text",
+        id_key: str = "id",
+        default_metadata: dict = None,
+        recursive: bool = True,
+        glob_pattern: str | None = None,
+        shuffle_files: bool = False,
+        max_num_retries: int = 100,
+        # Common Crawl says to wait at least 1 second between requests: https://status.commoncrawl.org/
+        timeout_s: int = 1,
+    ):
+        super().__init__(
+            data_folder,
+            paths_file,
+            compression,
+            limit,
+            skip,
+            file_progress,
+            doc_progress,
+            adapter,
+            text_key,
+            id_key,
+            default_metadata,
+            recursive,
+            glob_pattern,
+            shuffle_files,
+            max_num_retries,
+            timeout_s,
+        )
+
+    def iter_records(self, f):
+        from fastwarc.warc import ArchiveIterator, WarcRecordType
+
+        return ArchiveIterator(
+            f,
+            record_types=WarcRecordType.response | WarcRecordType.conversion,
+            parse_http=True,
+        )
+
+    def process_record(self, record) -> dict | None:
+        return process_fastwarc_record(record)
@@ -74,9 +74,15 @@ class RetryWarcReader(WarcReader):
         self.max_num_retries = max_num_retries
         self.timeout_s = timeout_s
 
-    def read_file(self, filepath: str):
+    def iter_records(self, f):
         from warcio.archiveiterator import ArchiveIterator
 
+        return ArchiveIterator(f)
+
+    def process_record(self, record) -> dict | None:
+        return process_record(record)
+
+    def read_file(self, filepath: str):
         last_emitted_index = -1
         num_retries = self.max_num_retries
         while True:
@@ -85,12 +91,12 @@ class RetryWarcReader(WarcReader):
                     start_index = last_emitted_index + 1
                     if start_index > 0:
                         logger.info(f"Resuming {filepath} from record index {start_index}")
-                    for ri, record in enumerate(ArchiveIterator(f)):
+                    for ri, record in enumerate(self.iter_records(f)):
                         if ri < start_index:
                             continue
 
                         with self.track_time():
-                            extracted_data = process_record(record)
+                            extracted_data = self.process_record(record)
                             if not extracted_data:
                                 continue
                             document = self.get_document_from_dict(extracted_data, filepath, ri)
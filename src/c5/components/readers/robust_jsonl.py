@@ -1,3 +1,4 @@
+import os
 import random
 from pathlib import Path
 from typing import Callable, Literal
@@ -86,9 +87,13 @@ class RobustJsonlReader(JsonlReader):
         if data:
             yield from data
 
-        # Clean up if the starting directory was empty
-        if not self.pdir.exists() or len(list(self.pdir.iterdir())) == 0:
+        # Clean up if the starting directory was empty. Only the first entry is needed to know that it is not,
+        # so do not list the (possibly tens of thousands of) files in it
+        if not self.pdir.exists():
             return
+        with os.scandir(self.pdir) as entries:
+            if next(entries, None) is None:
+                return
 
         files_shard = (
             self.data_folder.get_shard(rank, world_size, recursive=self.recursive, glob_pattern=self.glob_pattern)
@@ -1,18 +1,69 @@
 import gzip
 import io
 import json
+import os
+import queue
+import re
+import tempfile
+import threading
 import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import lru_cache
 from os import PathLike
 from pathlib import Path
-from typing import Generator
+from typing import Callable, Generator, Iterable, TypeVar
 
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
 import requests
 import yaml
-from huggingface_hub import list_repo_files, upload_file
+from huggingface_hub import list_repo_files, upload_file, upload_folder
 from huggingface_hub.file_download import hf_hub_download
 from tqdm import tqdm
 
-from c5.utils import is_in_fineweb
+from c5.utils import is_in_fineweb, uuid_re
+
+
+try:
+    # ISA-L's gzip implementation is a drop-in replacement for the standard library's that decompresses
+    # considerably faster (install `isal`)
+    from isal import igzip as fast_gzip
+except ImportError:
+    fast_gzip = gzip
+
+try:
+    # orjson parses considerably faster than the standard library, directly from bytes. Its errors subclass
+    # json.JSONDecodeError
+    from orjson import loads as json_loads
+except ImportError:
+    json_loads = json.loads
+
+try:
+    # The libyaml-based loader is considerably faster, but is only available if PyYAML was built against libyaml
+    from yaml import CSafeLoader as YamlSafeLoader
+except ImportError:
+    from yaml import SafeLoader as YamlSafeLoader
+
+T = TypeVar("T")
+
+# Settings used for all parquet files that we write (and upload). Rows contain full web documents, so
+# row groups are kept at 100k rows to bound the memory needed to write/read a single row group
+PARQUET_ROW_GROUP_SIZE = 100_000
+PARQUET_WRITE_KWARGS = {
+    "compression": "zstd",
+    "compression_level": 3,
+    "use_dictionary": True,
+    "data_page_size": 1 << 20,
+    "write_statistics": True,
+    # Column/offset indexes let readers skip pages based on their statistics
+    "write_page_index": True,
+}
+
+# Host part of a URL, e.g. "https://user@sub.example.com:443/path" -> "sub.example.com"
+URL_HOST_PATTERN = r"^(?:[a-zA-Z][a-zA-Z0-9+.\-]*:)?//(?:[^@/?#]*@)?(?P<host>[^/:?#]+)"
 
 
 def yield_repo_parquet_files(
@@ -21,13 +72,15 @@ def yield_repo_parquet_files(
     only_dumps: list[str] | None = None,
     skip_dumps: list[str] | None = None,
     skip_files_with_suffix: list[str] | None = None,
+    skip_files: set[str] | frozenset[str] | None = None,
     skip_non_fineweb_dumps: bool = False,
+    max_workers: int = 1,
 ) -> Generator[tuple[str, str], None, None]:
     """
     Download all parquet files from the given repo, skipping the ones in skip_dumps
     and only keeping the ones in only_dumps. The files are downloaded to the tmp_dir.
-    The files are downloaded one-by-one, and after each downloaded file its remote parquet URI
-    as well as its local file path are yielded as a tuple.
+    After each downloaded file its remote parquet URI as well as its local file path are yielded
+    as a tuple, in the order of the files in the repo.
 
     Args:
         repo_name (str): The name of the repo to download from.
@@ -36,11 +89,17 @@ def yield_repo_parquet_files(
         skip_dumps (list[str] | None): A list of dumps to skip. If None, no dumps are skipped.
         skip_files_with_suffix (list[str] | None): A list of suffixes to skip. If None, no suffixes are skipped.
         Useful if you want to skip specific files, e.g. data/CC-MAIN-2024-18/afr/000_00000.parquet.
+        skip_files (set[str] | frozenset[str] | None): Exact paths in the repo to skip, e.g.
+        data/CC-MAIN-2024-18/afr/000_00000.parquet. Unlike skip_files_with_suffix, this is a constant-time
+        lookup per file, so prefer it to skip many files.
         skip_non_fineweb_dumps (bool): If True, skip dumps that are not in FineWeb(-2).
+        max_workers (int): The number of files to download concurrently. At most this many downloaded files
+        are waiting to be consumed at any time, which limits disk usage.
     """
     skip_dumps = skip_dumps or []
     only_dumps = only_dumps or []
     skip_files_with_suffix = skip_files_with_suffix or []
+    skip_files = skip_files or frozenset()
     all_repo_files = list_repo_files(dataset_name, repo_type="dataset")
     all_dumps = {f.split("/")[1] for f in all_repo_files if f.startswith("data/CC-MAIN")}
 
@@ -52,8 +111,24 @@ def yield_repo_parquet_files(
     if only_dumps:
         cfg_parquet_files = [f for f in cfg_parquet_files if f.split("/")[1] in only_dumps]
 
-    tmp_dir = str(Path(__file__).parent.parent / "tmp" / "remove_domains")
+    tmp_dir = tmp_dir or tempfile.mkdtemp()
+
+    def download(pf: Path) -> tuple[str, str]:
+        print(f"Processing {pf}")
+        return next(
+            download_and_yield_with_retry(
+                dataset_name,
+                remote_filename=pf.name,
+                remote_subfolder=pf.parent,
+                local_dir=tmp_dir,
+            )
+        )
+
+    pfs = []
     for remote_parquet_uri in cfg_parquet_files:
+        if remote_parquet_uri in skip_files:
+            continue
+
         if any(remote_parquet_uri.endswith(suffix) for suffix in skip_files_with_suffix):
             print(f"Skipping {remote_parquet_uri} because it ends with one of the suffixes...")
             continue
@@ -67,13 +142,99 @@ def yield_repo_parquet_files(
             if not do_process:
                 continue
 
-        print(f"Processing {pf}")
-        yield from download_and_yield_with_retry(
-            dataset_name,
-            remote_filename=pf.name,
-            remote_subfolder=pf.parent,
-            local_dir=tmp_dir,
-        )
+        pfs.append(pf)
+
+    if max_workers <= 1:
+        for pf in pfs:
+            yield download(pf)
+        return
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = deque()
+        try:
+            for pf in pfs:
+                futures.append(executor.submit(download, pf))
+                if len(futures) >= max_workers:
+                    yield futures.popleft().result()
+
+            while futures:
+                yield futures.popleft().result()
+        finally:
+            # If the consumer stopped early, do not start the remaining downloads and remove the finished ones
+            for future in futures:
+                future.cancel()
+            for future in futures:
+                if not future.cancelled() and future.exception() is None:
+                    Path(future.result()[1]).unlink(missing_ok=True)
+
+
+def prefetch(
+    iterable: Iterable[T], buffer_size: int = 2, discard: Callable[[T], None] | None = None
+) -> Generator[T, None, None]:
+    """
+    Consume the given iterable in a background thread and yield its items, keeping at most `buffer_size`
+    items ready ahead of the consumer. This is useful to overlap network-bound work (e.g. downloading the next
+    file in `yield_repo_parquet_files`) with the processing of the current item.
+    Exceptions raised by the iterable are re-raised in the consuming thread. If the consumer stops early (an
+    exception while processing an item, or the generator is closed), the background thread stops fetching and
+    closes the iterable, and the items that were fetched but never consumed are passed to `discard`.
+
+    Args:
+        iterable (Iterable): The iterable to consume in the background.
+        buffer_size (int): The maximum number of items to fetch ahead of the consumer.
+        discard (Callable | None): Called with every fetched item that was not consumed, e.g. to remove
+        downloaded files.
+    """
+    buffer = queue.Queue(maxsize=buffer_size)
+    stop = threading.Event()
+    done = object()
+
+    def put(entry: tuple) -> bool:
+        # Do not block forever on a full buffer once the consumer has stopped
+        while not stop.is_set():
+            try:
+                buffer.put(entry, timeout=0.1)
+            except queue.Full:
+                continue
+            return True
+        return False
+
+    def producer():
+        iterator = iter(iterable)
+        try:
+            for item in iterator:
+                if not put((item, None)):
+                    if discard is not None:
+                        discard(item)
+                    break
+        except Exception as exc:
+            put((None, exc))
+        finally:
+            if stop.is_set() and hasattr(iterator, "close"):
+                iterator.close()
+            put((done, None))
+
+    thread = threading.Thread(target=producer, daemon=True)
+    thread.start()
+
+    try:
+        while True:
+            item, exc = buffer.get()
+            if exc is not None:
+                raise exc
+            if item is done:
+                break
+            yield item
+    finally:
+        stop.set()
+        thread.join()
+        while True:
+            try:
+                item, exc = buffer.get_nowait()
+            except queue.Empty:
+                break
+            if exc is None and item is not done and discard is not None:
+                discard(item)
 
 
 def download_and_yield_with_retry(
@@ -155,6 +316,152 @@ def upload_with_retry(
     return result
 
 
+def upload_folder_with_retry(
+    repo_id: str,
+    folder_path: str | PathLike,
+    path_in_repo: str | None = None,
+    num_retries: int = 3,
+    commit_message: str | None = None,
+    allow_patterns: list[str] | str | None = None,
+):
+    """
+    Upload the contents of a local folder to the given HF repo in a single commit, retrying up to
+    num_retries times in case of failure. Compared to uploading files one-by-one, this batches the
+    uploads so that many files are pushed concurrently and only one commit is created.
+
+    Args:
+        repo_id (str): The ID of the repo to upload to.
+        folder_path (str | PathLike): The local folder to upload.
+        path_in_repo (str | None): The path in the repo to upload the folder to. If None, the root of the repo.
+        num_retries (int): The number of times to retry the upload in case of failure.
+        commit_message (str | None): An optional description for the commit message.
+        allow_patterns (list[str] | str | None): If given, only files matching these patterns are uploaded.
+    """
+    result = None
+    while num_retries:
+        try:
+            result = upload_folder(
+                folder_path=folder_path,
+                path_in_repo=path_in_repo,
+                repo_type="dataset",
+                repo_id=repo_id,
+                commit_message=commit_message,
+                allow_patterns=allow_patterns,
+            )
+        except Exception as exc:
+            num_retries -= 1
+            print(f"Error uploading {folder_path}: {exc}")
+            if not num_retries:
+                raise exc
+        else:
+            break
+
+    return result
+
+
+@contextmanager
+def atomic_parquet_writer(
+    local_fname: str | PathLike, schema: pa.Schema, **writer_kwargs
+) -> Generator[pq.ParquetWriter, None, None]:
+    """
+    Context manager that yields a ParquetWriter to a temporary file next to `local_fname` (so on the same
+    filesystem), which replaces `local_fname` only once writing has finished successfully. If anything fails
+    while writing, the temporary file is removed and the original file is left untouched.
+
+    Args:
+        local_fname (str | PathLike): The path to the parquet file to (over)write.
+        schema (pa.Schema): The schema of the new file.
+        **writer_kwargs: Additional keyword arguments for the ParquetWriter, e.g. PARQUET_WRITE_KWARGS.
+    """
+    tmp_fname = f"{local_fname}.tmp"
+    writer = pq.ParquetWriter(tmp_fname, schema, **writer_kwargs)
+    try:
+        yield writer
+        writer.close()
+    except BaseException:
+        writer.close()
+        Path(tmp_fname).unlink(missing_ok=True)
+        raise
+
+    os.replace(tmp_fname, local_fname)
+
+
+def verify_parquet_schema(local_fname: str | PathLike, schema: pa.Schema):
+    """
+    Verify that the given parquet file can be read with the given schema. Only the footer of the file is read
+    so this is cheap, even for large files.
+
+    Args:
+        local_fname (str | PathLike): The path to the local parquet file.
+        schema (pa.Schema): The expected schema.
+
+    Raises:
+        Exception: If the schema of the file cannot be cast to the given schema.
+    """
+    try:
+        pq.read_schema(local_fname).empty_table().cast(schema)
+    except Exception as exc:
+        raise Exception(f"Could not read modified {local_fname}") from exc
+
+
+@lru_cache(maxsize=8)
+def _build_domain_lookup(remove_domains: frozenset[str]) -> tuple[pa.Array, str | None]:
+    """
+    Build the Arrow value set (for exact matches) and the RE2 pattern (for subdomain matches) for the given domains.
+    This is cached so that the lookup is only built once for the many row groups/files that are checked.
+    """
+    remove_domains = sorted({domain.lower() for domain in remove_domains})
+    value_set = pa.array(remove_domains, type=pa.string())
+    if not remove_domains:
+        return value_set, None
+
+    subdomain_pattern = r"\.(?:" + "|".join(re.escape(domain) for domain in remove_domains) + r")$"
+    return value_set, subdomain_pattern
+
+
+def compute_keep_mask(urls: pa.Array | pa.ChunkedArray, remove_domains: Iterable[str]) -> pa.ChunkedArray:
+    """
+    Vectorized check of which URLs do not belong to any of the given registrable domains (e.g. "bbc.co.uk"),
+    i.e. whose host is neither one of the domains nor a subdomain of one. This gives the same result as comparing
+    the tldextract'ed "domain.suffix" of each URL against the domains, but without per-row Python calls.
+    URLs without a parseable host are kept.
+
+    Args:
+        urls (pa.Array | pa.ChunkedArray): The URLs to check.
+        remove_domains (Iterable[str]): The registrable domains to remove. Pass a frozenset when calling this
+        repeatedly with the same domains so that the lookup structures are only built once.
+
+    Returns:
+        pa.ChunkedArray: A boolean mask that is True for the URLs to keep.
+    """
+    value_set, subdomain_pattern = _build_domain_lookup(frozenset(remove_domains))
+
+    hosts = pc.struct_field(pc.extract_regex(urls, URL_HOST_PATTERN), [0])
+    hosts = pc.utf8_rtrim(pc.utf8_lower(hosts), characters=".")
+
+    remove = pc.is_in(hosts, value_set=value_set)
+    if subdomain_pattern is not None:
+        remove = pc.or_(remove, pc.match_substring_regex(hosts, subdomain_pattern))
+
+    return pc.invert(pc.fill_null(remove, False))
+
+
+def extract_uuids(uuid_urns: pa.Array | pa.ChunkedArray) -> pa.Array | pa.ChunkedArray:
+    """
+    Vectorized version of `c5.utils.extract_uuid`: extract the UUIDs from an array of URNs, e.g.
+    "<urn:uuid:6a8657b3-84d0-45df-b4b2-5fb6eef55ee5>" -> "6a8657b384d045dfb4b25fb6eef55ee5", which is
+    compatible with the DuckDB UUID type.
+
+    Args:
+        uuid_urns (pa.Array | pa.ChunkedArray): The URNs to extract the UUIDs from.
+
+    Returns:
+        pa.Array | pa.ChunkedArray: The extracted UUIDs, without dashes.
+    """
+    uuids = pc.replace_substring_regex(uuid_urns, pattern=uuid_re.pattern, replacement=r"\1")
+    return pc.replace_substring(uuids, pattern="-", replacement="")
+
+
 def get_fw2_language_threshold(languages: list[str]) -> dict[str, float]:
     """
     Get the language threshold for the given languages from the FineWeb-2 repository.
@@ -171,7 +478,7 @@ def get_fw2_language_threshold(languages: list[str]) -> dict[str, float]:
     for pfin in pcfg_dir.glob("*.yml"):
         lang = pfin.stem
         with pfin.open("r", encoding="utf-8") as fhin:
-            cfg = yaml.safe_load(fhin)
+            cfg = yaml.load(fhin, Loader=YamlSafeLoader)
         lang2threshold[lang] = cfg["language_score"]
 
     return lang2threshold
@@ -222,7 +529,48 @@ def download_fw2_language_configs(languages: list[str]) -> str:
     return str(pdout)
 
 
-def yield_jsonl_gz_data_robust(pfiles: list[PathLike], disable_tqdm: bool = False):
+def iter_jsonl_gz_robust(pfin: PathLike, drop_keys: tuple[str, ...] = ()) -> Generator[dict, None, None]:
+    """
+    Read a single .jsonl.gz file in a robust way, skipping incomplete lines, and yield one sample at a
+    time (parse-able JSON line).
+
+    Args:
+        pfin (PathLike): Path to the .jsonl.gz file.
+        drop_keys (tuple[str, ...]): Keys to remove from every sample, e.g. ("text",) if the text is not needed.
+    """
+    # Read bytes, which the JSON parser decodes itself, rather than decoding every line to a string first
+    with fast_gzip.open(pfin, "rb") as fhin:
+        num_failures = 0
+        try:
+            # readline() is faster than iterating over the (buffered) gzip file
+            while line := fhin.readline():
+                try:
+                    sample = json_loads(line)
+                except json.JSONDecodeError:
+                    # Handle partial or malformed JSON (incomplete writes)
+                    num_failures += 1
+                    continue
+                for key in drop_keys:
+                    sample.pop(key, None)
+                yield sample
+        except EOFError:
+            # Handle unexpected EOF in gzip, which can only be raised by the stream and ends the file
+            num_failures += 1
+        if num_failures:
+            print(f"Skipped {num_failures:,} corrupt line(s) in {pfin}")
+
+
+def read_jsonl_gz_robust(pfin: PathLike, drop_keys: tuple[str, ...] = ()) -> list[dict]:
+    """
+    Read all samples of a single .jsonl.gz file, see `iter_jsonl_gz_robust`. Defined at the module level
+    so that it can be run in a worker process.
+    """
+    return list(iter_jsonl_gz_robust(pfin, drop_keys))
+
+
+def yield_jsonl_gz_data_robust(
+    pfiles: list[PathLike], disable_tqdm: bool = False, num_workers: int = 1, drop_keys: tuple[str, ...] = ()
+):
     """
     Given a set of .jsonl.gz files, this function reads them in a robust way, skipping incomplete lines,
     and yielding one sample at a time (parse-able JSON line).
@@ -230,31 +578,32 @@ def yield_jsonl_gz_data_robust(pfiles: list[PathLike], disable_tqdm: bool = Fals
     Args:
         pfiles (list[Path]): List of paths to .jsonl.gz files.
         disable_tqdm (bool): Whether to disable the tqdm progress bar.
+        num_workers (int): The number of processes to decompress and parse files in. If larger than 1,
+        files are read entirely in the worker processes and at most `num_workers` files are waiting to be
+        consumed at any time, which limits memory usage. Samples are yielded in the order of the files.
+        drop_keys (tuple[str, ...]): Keys to remove from every sample while parsing, so that large unused fields
+        (e.g. "text") are never collected or sent back from the worker processes.
     """
     pfiles = [Path(pf) for pf in pfiles]
+    pfiles = [pf for pf in pfiles if pf.stat().st_size > 0]
     with tqdm(total=len(pfiles), desc="Reading", unit="file", disable=disable_tqdm) as pbar:
-        for pfin in pfiles:
-            if pfin.stat().st_size == 0:
-                continue
-
-            with gzip.open(pfin, "rt", encoding="utf-8") as fhin:
-                num_failures = 0
-                while True:
-                    try:
-                        line = fhin.readline()
-                        if not line:
-                            break  # End of currently available content
-                        yield json.loads(line)
-                    except json.JSONDecodeError:
-                        # Handle partial or malformed JSON (incomplete writes)
-                        num_failures += 1
-                    except EOFError:
-                        # Handle unexpected EOF in gzip
-                        num_failures += 1
-                        break
-                if num_failures:
-                    print(f"Skipped {num_failures:,} corrupt line(s) in {pfin}")
-            pbar.update(1)
+        if num_workers <= 1:
+            for pfin in pfiles:
+                yield from iter_jsonl_gz_robust(pfin, drop_keys)
+                pbar.update(1)
+            return
+
+        with ProcessPoolExecutor(max_workers=num_workers) as executor:
+            futures = deque()
+            for pfin in pfiles:
+                futures.append(executor.submit(read_jsonl_gz_robust, pfin, drop_keys))
+                if len(futures) >= num_workers:
+                    yield from futures.popleft().result()
+                    pbar.update(1)
+
+            while futures:
+                yield from futures.popleft().result()
+                pbar.update(1)
 
 
 def download_warc_urls_file(dump: str, output_folder: str, overwrite: bool = False) -> str:
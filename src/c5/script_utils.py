@@ -1,25 +1,28 @@
+import json
+import os
 import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from functools import lru_cache
+from os import PathLike
 from pathlib import Path
-from typing import Literal
+from typing import TYPE_CHECKING, Literal, TypeVar
 
-import fsspec
 import pyarrow as pa
-from datasets import load_dataset
-from datatrove.pipeline.base import PipelineStep
-from datatrove.pipeline.extractors import Trafilatura
-from datatrove.pipeline.filters import URLFilter
-from datatrove.pipeline.formatters import FTFYFormatter, PIIFormatter, SymbolLinesFormatter
-from datatrove.pipeline.readers import JsonlReader
-from datatrove.pipeline.writers import HuggingFaceDatasetWriter, JsonlWriter
+import pyarrow.parquet as pq
+import yaml
 from huggingface_hub import hf_hub_download, list_repo_files
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict, Field, ValidationInfo, field_validator
 
-from c5.components.annotators import FWSingleDBContainmentAnnotator, LicenseAnnotator
-from c5.components.filters import CCTextFilter, LanguageFilterWithIgnore, LicenseFilter
-from c5.components.readers import RetryWarcReader, RobustJsonlReader
-from c5.data_utils import download_warc_urls_file, get_fw2_language_threshold
+from c5.data_utils import YamlSafeLoader, download_warc_urls_file, get_fw2_language_threshold
+from c5.utils import PROJECT_ROOT, get_available_cpus
 from c5.version import version as c5_version
 
+
+if TYPE_CHECKING:
+    from datatrove.pipeline.base import PipelineStep
+
 if ver_match := re.match(r"^\d+\.\d+\.\d+", c5_version):
     c5_version = ver_match.group(0)
 
@@ -61,9 +64,39 @@ LANGUAGES_EU = [
 ]
 
 
+ConfigT = TypeVar("ConfigT", bound=BaseModel)
+
+
+def load_config(config_path: str | PathLike, config_cls: type[ConfigT]) -> ConfigT:
+    """
+    Load a YAML config file and validate it with the given config class.
+
+    Args:
+        config_path (str | PathLike): Path to the YAML config file.
+        config_cls (type[ConfigT]): The config class to validate the config with, e.g. BaseConfig.
+
+    Returns:
+        ConfigT: The validated config.
+
+    Raises:
+        FileNotFoundError: If the config file does not exist.
+    """
+    pfin = Path(config_path)
+    if not pfin.is_file():
+        raise FileNotFoundError(f"Config file {config_path} not found")
+
+    # Let the parser read the bytes from the file itself rather than decoding the whole file to a string first
+    with pfin.open("rb") as fhin:
+        config = yaml.load(fhin, Loader=YamlSafeLoader)
+    return config_cls.model_validate(config or {})
+
+
 class BaseUploadConfig(BaseModel):
     """Base Config class for local and Slurm configurations"""
 
+    # Configs are not modified after loading, and unknown (e.g. misspelled) keys should not be silently ignored
+    model_config = ConfigDict(frozen=True, extra="forbid")
+
     tasks: int = 1
     workers: int = -1
     randomize_start_duration: int = 0
@@ -81,32 +114,51 @@ class SlurmUploadConfig(BaseUploadConfig):
 class BaseConfig(BaseModel):
     """Base Config class for local and Slurm configurations"""
 
+    # Configs are not modified after loading, and unknown (e.g. misspelled) keys should not be silently ignored
+    model_config = ConfigDict(frozen=True, extra="forbid")
+
     main_tasks: int = 1
     containment_tasks: int = 1
     main_workers: int = -1
     containment_workers: int = -1
 
     randomize_start_duration: int = 0
-    languages: list | None | Literal["v1", "eu"] = None
+    # Validated into a tuple of languages, see `resolve_languages`
+    languages: tuple[str, ...] | None | Literal["v1", "eu"] = Field(default=None, validate_default=True)
     ignore_undetermined: bool = True
     fw_duckdb_templ_path: str | None = None
     fw2_duckdb_templ_path: str | None = None
     overwrite_with_none: bool = False
-    ignore_duckdb_for: list[str] | None = None
+    ignore_duckdb_for: tuple[str, ...] | None = None
     limit: int = -1
     use_s3: bool = False
     download_block_size_bytes: int = 64 * 1024 * 1024  # 64MB
     max_num_retries: int = 100
     timeout_s: int = 1
     contact_email: str | None = None
-
-    def model_post_init(self, __context):
-        if not self.languages:
-            self.languages = retrieve_supported_languages()
-        elif self.languages == "v1":
-            self.languages = LANGUAGES_V1
-        elif self.languages == "eu":
-            self.languages = LANGUAGES_EU
+    use_fastwarc: bool = False
+    trafilatura_no_fallback: bool = False
+    duckdb_download_workers: int = 8
+
+    @field_validator("languages", mode="after")
+    @classmethod
+    def resolve_languages(cls, languages: tuple[str, ...] | None | Literal["v1", "eu"]) -> tuple[str, ...]:
+        if not languages:
+            return tuple(retrieve_supported_languages())
+        elif languages == "v1":
+            return tuple(LANGUAGES_V1)
+        elif languages == "eu":
+            return tuple(LANGUAGES_EU)
+        return languages
+
+    @field_validator("fw_duckdb_templ_path", "fw2_duckdb_templ_path", mode="after")
+    @classmethod
+    def check_duckdb_templ_path(cls, templ_path: str | None, info: ValidationInfo) -> str | None:
+        # Fail when loading the config rather than after downloading databases or submitting jobs
+        placeholder = "{dump}" if info.field_name == "fw_duckdb_templ_path" else "{language}"
+        if templ_path is not None and placeholder not in templ_path:
+            raise ValueError(f"{info.field_name} must contain the placeholder '{placeholder}'")
+        return templ_path
 
 
 class SlurmConfig(BaseConfig):
@@ -123,6 +175,57 @@ class SlurmConfig(BaseConfig):
     main_stagger_max_array_jobs: int = 900
 
 
+@dataclass(frozen=True, slots=True)
+class RunPaths:
+    """Output and log directories of a pipeline run for a single dump, so that they are computed once and
+    the local and Slurm scripts share the same layout."""
+
+    main_output_dir: str
+    containment_output_dir: str
+    main_logs_dir: str
+    containment_logs_dir: str
+    main_slurm_logs_dir: str
+    containment_slurm_logs_dir: str
+
+    @classmethod
+    def from_output_path(cls, output_path: str, dump: str) -> "RunPaths":
+        """
+        Args:
+            output_path (str): The output path of the run. The main pipeline writes to `{output_path}-main/{dump}/`
+            and the containment pipelines to `{output_path}/{dump}/`.
+            dump (str): The Common Crawl dump, e.g. 'CC-MAIN-2024-51'.
+
+        Returns:
+            RunPaths: The directories of the run.
+        """
+        output_path = output_path.rstrip("/")
+        logs_dir = PROJECT_ROOT / "logs"
+        slurm_logs_dir = PROJECT_ROOT / "slurm-logs"
+        return cls(
+            main_output_dir=f"{output_path}-main/{dump}/",
+            containment_output_dir=f"{output_path}/{dump}/",
+            main_logs_dir=str(logs_dir / "main-logs" / dump),
+            containment_logs_dir=str(logs_dir / "containment-logs" / dump),
+            main_slurm_logs_dir=str(slurm_logs_dir / "main-logs" / dump),
+            containment_slurm_logs_dir=str(slurm_logs_dir / "containment-logs" / dump),
+        )
+
+    def containment_input_dir(self, language: str) -> str:
+        """The main pipeline's output directory for the given language."""
+        return f"{self.main_output_dir}{language}/"
+
+    def has_intermediate_main_output(self) -> bool:
+        """
+        Whether a previous run of the main pipeline already completed tasks that wrote their output to the
+        main output directory, to be annotated by the containment pipelines. Such a run has to keep this
+        layout, also if the main pipeline could write the final output itself, or its output is never annotated.
+        """
+        if not has_completed_tasks(self.main_logs_dir) or not os.path.isdir(self.main_output_dir):
+            return False
+        with os.scandir(self.main_output_dir) as entries:
+            return next(entries, None) is not None
+
+
 def build_main_pipeline(
     dump: str,
     output_folder: str,
@@ -135,14 +238,17 @@ def build_main_pipeline(
     max_num_retries: int = 100,
     timeout_s: int = 1,
     contact_email: str | None = None,
-) -> list[PipelineStep]:
+    use_fastwarc: bool = False,
+    trafilatura_no_fallback: bool = False,
+    final_output_folder: str | None = None,
+) -> list["PipelineStep"]:
     """Build a pipeline for extracting and filtering web pages from Common Crawl. This is a separate
     function so that it can be used in both the local and Slurm scripts.
 
     Args:
         dump (str): Common Crawl dump to process
         output_folder (str): Path to the output directory. Files will be written as
-        ${language}_${language_script}/${rank}.jsonl.gz
+        ${language}_${language_script}/${rank}.jsonl.zst
         languages (list[str]): List of languages to filter for or None
         limit (int, optional): Maximum number of pages to process per task, useful for debugging.
         -1 = no limit. Defaults to -1.
@@ -159,10 +265,31 @@ def build_main_pipeline(
         a WARC file. Defaults to 1.
         contact_email (str | None, optional): Contact email to include in the User-Agent header.
         Defaults to None. Only implemented for HTTP, not S3.
+        use_fastwarc (bool, optional): Whether to read the WARC files with FastWARC instead of warcio, which
+        is considerably faster. Defaults to False.
+        trafilatura_no_fallback (bool, optional): Whether to skip Trafilatura's fallback extractors (readability and
+        justext), which are run when the main extraction looks poor. This considerably speeds up extraction but may
+        lead to slightly different (shorter) texts than previous runs. Defaults to False.
+        final_output_folder (str | None, optional): If given, the containment pipeline is not needed (none of the
+        languages can be found in the databases). The 'found_in_fw' field is then set to None for all documents and
+        they are written directly to this folder, in the same format as the containment pipeline's output. The
+        `output_folder` is then only used for the WARC URLs file. Defaults to None.
 
     Returns:
         list[PipelineStep]: List of pipeline steps (i.e., the pipeline components)
     """
+    # The pipeline steps are imported here rather than at the top of the module, because they pull in heavy
+    # dependencies (lxml, trafilatura, fasttext, ...) that are not needed to only load configs or submit jobs
+    import fsspec
+    from datatrove.pipeline.extractors import Trafilatura
+    from datatrove.pipeline.filters import URLFilter
+    from datatrove.pipeline.formatters import FTFYFormatter, PIIFormatter, SymbolLinesFormatter
+    from datatrove.pipeline.writers import JsonlWriter
+
+    from c5.components.annotators import FWDBContainmentAnnotator, LicenseAnnotator
+    from c5.components.filters import CCTextFilter, LanguageFilterWithIgnore, LicenseFilter
+    from c5.components.readers import RetryFastWarcReader, RetryWarcReader
+
     fw2_languages = [l for l in languages if l != "eng_Latn"]
     lang_thresholds = get_fw2_language_threshold(fw2_languages)
 
@@ -177,12 +304,14 @@ def build_main_pipeline(
                     f"Language {lang} not found in the language thresholds. Something must have gone wrong when loading the data."
                 )
 
+    reader_cls = RetryFastWarcReader if use_fastwarc else RetryWarcReader
     if use_s3:
-        # Use the S3 bucket
+        # Use the S3 bucket. The WARC paths are read from the (cached) paths listing of the dump rather than
+        # listing all ~80k objects in the bucket at the start of every run
         fs_options = {}
-        reader = RetryWarcReader(
-            (f"s3://commoncrawl/crawl-data/{dump}/segments/", fs_options),
-            glob_pattern="*/warc/*",
+        reader = reader_cls(
+            ("s3://commoncrawl/", fs_options),
+            paths_file=get_warc_paths_file(dump),
             default_metadata={"dump": dump},
             limit=limit,
             max_num_retries=max_num_retries,
@@ -201,7 +330,7 @@ def build_main_pipeline(
         # Use the HTTPS endpoint (over Cloudfront)
         # A file with one path per line, e.g. crawl-data/CC-MAIN-2025-33/segments/1754151279521.11/warc/CC-MAIN-20250802220907-20250803010907-00003.warc.gz
         warc_url_file = download_warc_urls_file(dump, output_folder, overwrite=False)
-        reader = RetryWarcReader(
+        reader = reader_cls(
             ("https://data.commoncrawl.org", fs),
             paths_file=warc_url_file,
             default_metadata={"dump": dump},
@@ -210,13 +339,13 @@ def build_main_pipeline(
             timeout_s=timeout_s,
         )
 
-    return [
+    steps = [
         reader,
         URLFilter(extra_domains=extra_domains),
         CCTextFilter(),  # filter items without creativecommons.org in text (text-attr = read HTML at this point) -- cheap
         LicenseAnnotator(),
         LicenseFilter(),
-        Trafilatura(favour_precision=True, timeout=60.0, deduplicate=True),
+        Trafilatura(favour_precision=True, timeout=60.0, deduplicate=True, no_fallback=trafilatura_no_fallback),
         LanguageFilterWithIgnore(
             languages=languages, ignore_undetermined=ignore_undetermined, language_threshold=lang_thresholds
         ),
@@ -224,12 +353,36 @@ def build_main_pipeline(
         FTFYFormatter(),  # fix encoding issues. Important in a multilingual setting
         PIIFormatter(),  # remove PII
         SymbolLinesFormatter(symbols_to_remove=["|"], replace_char="\n"),  # fix trafilatura table artifacts
-        JsonlWriter(
-            output_folder=f"{output_folder}/",
-            output_filename="${language}_${language_script}/${rank}.jsonl.gz",
-        ),
     ]
 
+    if final_output_folder is None:
+        # Intermediate output that is only read by the containment pipeline, so use zstd: it is considerably
+        # faster than gzip at a similar compression ratio
+        steps.append(
+            JsonlWriter(
+                output_folder=f"{output_folder}/",
+                output_filename="${language}_${language_script}/${rank}.jsonl.zst",
+                compression="zstd",
+            )
+        )
+    else:
+        # Nothing to look up, so annotate in this pipeline rather than re-reading all of the output afterwards
+        steps += [
+            FWDBContainmentAnnotator(
+                fw_duckdb_path=None,
+                fw2_duckdb_templ_path=None,
+                added_key="found_in_fw",
+                overwrite_with_none=True,
+            ),
+            JsonlWriter(
+                output_folder=f"{final_output_folder}/",
+                output_filename="${language}_${language_script}/${rank}.jsonl.gz",
+                expand_metadata=True,
+            ),
+        ]
+
+    return steps
+
 
 def build_containment_pipeline(
     input_path: str,
@@ -237,7 +390,8 @@ def build_containment_pipeline(
     is_fw2: bool,
     output_folder: str,
     overwrite_with_none: bool = False,
-) -> list[PipelineStep]:
+    duckdb_threads: int | None = None,
+) -> list["PipelineStep"]:
     """
     Build a pipeline for annotating the web pages with the database containment information.
 
@@ -250,17 +404,26 @@ def build_containment_pipeline(
         overwrite_with_none (bool, optional): If True, the 'found' field will be set to `None` for all documents,
         regardless of the language. Useful if you know that a given dump does not occur in the other database.
         This improves speed as the database is not queried. Defaults to False.
+        duckdb_threads (int | None, optional): The number of threads that every task's DuckDB connection may use.
+        Defaults to None, i.e. DuckDB's default (all cores).
     """
+    from datatrove.pipeline.writers import JsonlWriter
+
+    from c5.components.annotators import FWSingleDBContainmentAnnotator
+    from c5.components.readers import RobustJsonlReader
+
     return [
         RobustJsonlReader(
             data_folder=input_path,
-            glob_pattern="**/*.jsonl.gz",
+            # Both zstd and (older) gzip outputs of the main pipeline, the compression is inferred from the suffix
+            glob_pattern="**/*.jsonl.*",
         ),
         FWSingleDBContainmentAnnotator(
             duckdb_path=duckdb_path,
             is_fw2=is_fw2,
             added_key="found_in_fw",
             overwrite_with_none=overwrite_with_none,
+            duckdb_threads=duckdb_threads,
         ),
         JsonlWriter(
             output_folder=f"{output_folder}/",
@@ -270,16 +433,45 @@ def build_containment_pipeline(
     ]
 
 
-def get_fw_c_and_d_domains() -> set[str]:
+@lru_cache(maxsize=1)
+def get_fw_c_and_d_domains(max_cache_age_s: int = 7 * 24 * 60 * 60) -> frozenset[str]:
     """
     Get the domains that were removed from FineWeb(-2) as a result from a cease-and-desist letter,
     collecting in this repository: BramVanroy/finewebs-copyright-domains
 
     These domains can then be forwarded to the URL filter's `extra_domains`, ensuring that
     these domains are not included in our dataset.
+
+    The parquet files are downloaded and read directly rather than with `datasets`, which would build
+    an Arrow cache for what is only a small lookup table. The resulting domains are cached in
+    PROJECT_ROOT/.cache/fw_c_and_d_domains.json so that repeated runs do not have to query the hub, and in
+    memory for repeated calls within the same process.
+
+    Args:
+        max_cache_age_s (int): Maximum age of the cached domains in seconds before they are retrieved from the
+        hub again. Defaults to one week.
+
+    Returns:
+        frozenset[str]: The domains to exclude.
     """
-    ds = load_dataset("BramVanroy/finewebs-copyright-domains", split="train")
-    return set(ds["domain"])
+    pfcache = PROJECT_ROOT / ".cache" / "fw_c_and_d_domains.json"
+    if pfcache.is_file() and time.time() - pfcache.stat().st_mtime < max_cache_age_s:
+        return frozenset(json.loads(pfcache.read_text(encoding="utf-8")))
+
+    repo_id = "BramVanroy/finewebs-copyright-domains"
+    domains = set()
+    for fname in list_repo_files(repo_id, repo_type="dataset"):
+        if fname.startswith("data/") and fname.endswith(".parquet"):
+            local_fname = hf_hub_download(repo_id, filename=fname, repo_type="dataset")
+            domains.update(pq.read_table(local_fname, columns=["domain"])["domain"].to_pylist())
+
+    # Write to a temporary file first so that concurrent runs never read a partially written cache
+    pfcache.parent.mkdir(parents=True, exist_ok=True)
+    pftmp = pfcache.with_name(f"{pfcache.name}.{os.getpid()}.tmp")
+    pftmp.write_text(json.dumps(sorted(domains)), encoding="utf-8")
+    os.replace(pftmp, pfcache)
+
+    return frozenset(domains)
 
 
 SCHEMA = pa.schema(
@@ -432,11 +624,132 @@ NO_FW_SCHEMA = pa.schema(
 )
 
 
+def get_warc_paths_file(dump: str) -> str:
+    """
+    Get the path to a local file with the paths of all WARC files in the given Common Crawl dump, one per line
+    and relative to the root of the bucket, e.g. crawl-data/CC-MAIN-2024-18/segments/.../warc/....warc.gz.
+    The file is cached in PROJECT_ROOT/.cache/warc_index so that it is only downloaded once per dump.
+
+    Args:
+        dump (str): The dump name, e.g. CC-MAIN-2024-18
+
+    Returns:
+        str: The path to the local file with WARC paths.
+    """
+    return download_warc_urls_file(dump, str(PROJECT_ROOT / ".cache" / "warc_index"), overwrite=False)
+
+
+def get_num_warc_files(dump: str) -> int:
+    """
+    Get the number of WARC files in the given Common Crawl dump.
+
+    Args:
+        dump (str): The dump name, e.g. CC-MAIN-2024-18
+
+    Returns:
+        int: The number of WARC files in the dump.
+    """
+    with open(get_warc_paths_file(dump), encoding="utf-8") as fhin:
+        return sum(1 for line in fhin if line.strip())
+
+
+def has_completed_tasks(logging_dir: str) -> bool:
+    """
+    Check whether datatrove has marked any task of an executor as completed in the given (local) logging directory.
+
+    Args:
+        logging_dir (str): The logging directory of the executor.
+
+    Returns:
+        bool: Whether at least one task has completed.
+    """
+    pdir = Path(logging_dir) / "completions"
+    if not pdir.is_dir():
+        return False
+    with os.scandir(pdir) as entries:
+        return next(entries, None) is not None
+
+
+def get_logged_num_tasks(logging_dir: str) -> int | None:
+    """
+    Get the number of tasks that a previous run used from the executor.json that datatrove saves in the
+    logging directory.
+
+    Args:
+        logging_dir (str): The logging directory of the executor.
+
+    Returns:
+        int | None: The number of tasks, or None if it could not be found.
+    """
+    pf_executor = Path(logging_dir) / "executor.json"
+    if not pf_executor.is_file():
+        return None
+    try:
+        executor_cfg = json.loads(pf_executor.read_text(encoding="utf-8"))
+    except json.JSONDecodeError:
+        return None
+    num_tasks = executor_cfg.get("world_size", executor_cfg.get("tasks"))
+    return num_tasks if isinstance(num_tasks, int) and num_tasks > 0 else None
+
+
+def get_effective_num_tasks(dump: str, tasks: int, workers: int, logging_dir: str | None = None) -> int:
+    """
+    Increase the number of tasks so that all workers can be used. Datatrove distributes the WARC
+    files over the tasks, so with fewer tasks than available workers (or CPUs, when workers=-1),
+    the remaining workers stay idle. The number of tasks is never lowered and never increased
+    beyond the number of WARC files in the dump.
+
+    Datatrove only tracks which task indices have completed, so resuming with a different number of tasks
+    would skip or overwrite tasks whose files have changed. Therefore, if a logging_dir is given, the number
+    of tasks is saved there and the saved number is reused when the run is resumed. Runs that were started
+    before the number was saved keep the number of tasks from datatrove's executor.json, or else the
+    configured number of tasks.
+
+    Args:
+        dump (str): The dump name, e.g. CC-MAIN-2024-18
+        tasks (int): The number of tasks as configured.
+        workers (int): The number of workers as configured, -1 to use all CPUs.
+        logging_dir (str | None): The logging directory of the executor, to save the number of tasks in.
+
+    Returns:
+        int: The number of tasks to use.
+    """
+    pf_num_tasks = Path(logging_dir) / "effective_num_tasks.txt" if logging_dir is not None else None
+    if pf_num_tasks is not None and pf_num_tasks.is_file():
+        prev_tasks = int(pf_num_tasks.read_text(encoding="utf-8"))
+        print(f"Resuming with the {prev_tasks} tasks of the previous run in {logging_dir}")
+        return prev_tasks
+
+    if pf_num_tasks is not None and (
+        has_completed_tasks(logging_dir) or (pf_num_tasks.parent / "executor.json").is_file()
+    ):
+        # Started before the number of tasks was saved, so do not change the number of tasks of that run
+        effective_tasks = get_logged_num_tasks(logging_dir) or tasks
+        print(f"Resuming with the {effective_tasks} tasks of the previous run in {logging_dir}")
+    else:
+        num_workers = workers if workers > 0 else get_available_cpus()
+        effective_tasks = max(tasks, min(get_num_warc_files(dump), num_workers))
+        if effective_tasks != tasks:
+            print(f"Increasing the number of tasks from {tasks} to {effective_tasks} to make use of all workers")
+
+    if pf_num_tasks is not None:
+        pf_num_tasks.parent.mkdir(parents=True, exist_ok=True)
+        pf_num_tasks.write_text(str(effective_tasks), encoding="utf-8")
+
+    return effective_tasks
+
+
+SBATCH_JOB_ID_REGEX = re.compile(r"Submitted batch job (\d+)")
+
+
 def job_id_retriever(job_id: str) -> str:
-    return re.search(r"Submitted batch job (\d+)", job_id).group(1)
+    return SBATCH_JOB_ID_REGEX.search(job_id).group(1)
+
 
+def build_upload_pipeline(jsonl_path: str, output_path: str, hf_repo: str, limit: int = -1) -> list["PipelineStep"]:
+    from datatrove.pipeline.readers import JsonlReader
+    from datatrove.pipeline.writers import HuggingFaceDatasetWriter
 
-def build_upload_pipeline(jsonl_path: str, output_path: str, hf_repo: str, limit: int = -1) -> list[PipelineStep]:
     return [
         JsonlReader(
             jsonl_path,
@@ -478,8 +791,8 @@ def get_dumps_with_duckdb(
     dump_year = int(dump_name.split("-")[2])
     dump_issue = int(dump_name.split("-")[3])
 
-    # Not in FineWeb-2
-    ignore_duckdb_for = ignore_duckdb_for or []
+    # Not in FineWeb-2. Copy so that the given list (e.g. from the config) is not modified
+    ignore_duckdb_for = list(ignore_duckdb_for or [])
 
     if dump_year > 2024 or (dump_year == 2024 and dump_issue > 18):
         ignore_duckdb_for += [lang for lang in languages if lang not in ["eng_Latn", "eng", "en"]]
@@ -517,7 +830,9 @@ def retrieve_supported_languages(include_english: bool = True) -> list[str]:
     return languages
 
 
-def download_duckdbs(dump_name: str, fw_duckdb_path: str, cfg: BaseConfig) -> tuple[list[str], bool]:
+def download_duckdbs(
+    dump_name: str, fw_duckdb_path: str, cfg: BaseConfig, max_parallel_downloads: int = 8
+) -> tuple[list[str], bool]:
     """
     Download the DuckDB databases from Hugging Face if they are not already present on-disk, and verify
     which languages should be ignored when querying the databases and whether ALL should be ignored.
@@ -533,6 +848,7 @@ def download_duckdbs(dump_name: str, fw_duckdb_path: str, cfg: BaseConfig) -> tu
         dump_name (str): Name of the dump (e.g., "CC-MAIN-2024-18")
         fw_duckdb_path (str): Path to the FineWeb DuckDB database (English) (filled in template URI).
         cfg (BaseConfig): Configuration object containing the paths to the databases and other settings.
+        max_parallel_downloads (int): Maximum number of databases to download concurrently. Defaults to 8.
 
     Returns:
         tuple[list[str], bool]: A tuple containing:
@@ -552,31 +868,35 @@ def download_duckdbs(dump_name: str, fw_duckdb_path: str, cfg: BaseConfig) -> tu
     )
 
     # Only download languages that are not in ignore_duckdb_for (occurs when crawl is too recent or in config ignore_duckdb_for)
-    duckdb_languages = []
-    for lang in cfg.languages:
-        if lang not in ignore_duckdb_for:
-            duckdb_languages.append(lang)
-
-    if duckdb_languages:
-        pfw = Path(fw_duckdb_path)
-        for lang in duckdb_languages:
-            if lang == "eng_Latn":
-                if not pfw.exists() or pfw.stat().st_size == 0:
-                    hf_hub_download(
-                        repo_id="BramVanroy/fineweb-duckdbs",
-                        filename=pfw.name,
-                        local_dir=pfw.parent,
-                        repo_type="dataset",
-                    )
-            else:
-                local_path = cfg.fw2_duckdb_templ_path.format(language=lang)
-                pf = Path(local_path)
-                if not pf.exists() or pf.stat().st_size == 0:
-                    hf_hub_download(
-                        repo_id="BramVanroy/fineweb-2-duckdbs",
-                        filename=pf.name,
-                        local_dir=pf.parent,
-                        repo_type="dataset",
-                    )
+    ignored_languages = frozenset(ignore_duckdb_for)
+    duckdb_languages = [lang for lang in cfg.languages if lang not in ignored_languages]
+
+    downloads = []
+    for lang in duckdb_languages:
+        if lang == "eng_Latn":
+            repo_id = "BramVanroy/fineweb-duckdbs"
+            pf = Path(fw_duckdb_path)
+        else:
+            repo_id = "BramVanroy/fineweb-2-duckdbs"
+            pf = Path(cfg.fw2_duckdb_templ_path.format(language=lang))
+
+        if not pf.exists() or pf.stat().st_size == 0:
+            downloads.append((repo_id, pf))
+
+    if downloads:
+        # The databases are independent, so download them concurrently rather than one after the other
+        with ThreadPoolExecutor(max_workers=min(len(downloads), max_parallel_downloads)) as executor:
+            futures = [
+                executor.submit(
+                    hf_hub_download,
+                    repo_id=repo_id,
+                    filename=pf.name,
+                    local_dir=pf.parent,
+                    repo_type="dataset",
+                )
+                for repo_id, pf in downloads
+            ]
+            for future in futures:
+                future.result()
 
     return ignore_duckdb_for, ignore_all_duckdb
@@ -9,11 +9,26 @@ from pathlib import Path
 PROJECT_ROOT = Path(__file__).parents[2]
 
 
+def get_available_cpus() -> int:
+    """
+    Get the number of CPUs that this process may run on. Unlike os.cpu_count(), this takes the CPU affinity
+    into account (as set by Slurm, taskset, ...), so that we do not start more workers than we can actually use.
+
+    Returns:
+        int: The number of available CPUs.
+    """
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        # Not available on all platforms, e.g. macOS
+        return os.cpu_count() or 1
+
+
 def print_system_stats():
     """
     Print out the number of CPU cores on the system as well as the available memory.
     """
-    print(f"Number of CPU cores: {os.cpu_count()}")
+    print(f"Number of CPU cores: {os.cpu_count()} ({get_available_cpus()} available to this process)")
 
     try:
         print(f"Available memory: {os.popen('free -h').read()}")
@@ -50,3 +65,62 @@ def is_in_fineweb(crawl: str, language: str) -> bool:
         return False
 
     return True
+
+
+def connect_duckdb(duckdb_path: str, threads: int | None = None, memory_limit: str | None = None):
+    """
+    Open a read-only connection to the given DuckDB database. The object cache is enabled so that
+    metadata is reused across the many batched containment queries against the same table.
+
+    Args:
+        duckdb_path (str): The path to the DuckDB database.
+        threads (int | None): The number of threads DuckDB may use. If None, DuckDB's default is used.
+        memory_limit (str | None): The memory limit for DuckDB, e.g. '16GB', to prevent swapping.
+        If None, DuckDB's default is used.
+
+    Returns:
+        duckdb.DuckDBPyConnection: The read-only connection.
+    """
+    import duckdb
+
+    config = {"enable_object_cache": True}
+    if threads is not None:
+        config["threads"] = threads
+    if memory_limit is not None:
+        config["memory_limit"] = memory_limit
+
+    return duckdb.connect(duckdb_path, read_only=True, config=config)
+
+
+def query_containment(con, ids: list[str], dumps: list[str] | None = None) -> list[bool]:
+    """
+    Check which of the given IDs (and optionally dumps) exist in the `data` table of a DuckDB
+    database. The batch is registered as an Arrow table and checked with a single semi-join, so
+    the query does not have to be re-parsed for every batch and the result does not depend on
+    the output order of the join.
+
+    Args:
+        con (duckdb.DuckDBPyConnection): The connection to the DuckDB database.
+        ids (list[str]): The IDs (UUIDs without dashes) to look up.
+        dumps (list[str] | None): The dumps of the IDs, if the table should also be matched on
+        its `dump` column (FineWeb-2). If None, only the `id` column is used (FineWeb).
+
+    Returns:
+        list[bool]: For each ID, whether it exists in the database.
+    """
+    import pyarrow as pa
+
+    columns = {"idx": pa.array(range(len(ids)), type=pa.int64()), "id": pa.array(ids, type=pa.string())}
+    join_condition = "b.id = d.id"
+    if dumps is not None:
+        columns["dump"] = pa.array(dumps, type=pa.string())
+        join_condition += " AND b.dump = d.dump"
+
+    con.register("batch_ids", pa.table(columns))
+    try:
+        found = con.execute(f"SELECT b.idx FROM batch_ids b SEMI JOIN data d ON {join_condition}").fetchall()
+    finally:
+        con.unregister("batch_ids")
+
+    found = {row[0] for row in found}
+    return [idx in found for idx in range(len(ids))]
@@ -0,0 +1,243 @@
+import gzip
+import json
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from c5.data_utils import (
+    atomic_parquet_writer,
+    compute_keep_mask,
+    extract_uuids,
+    prefetch,
+    verify_parquet_schema,
+    yield_jsonl_gz_data_robust,
+)
+from c5.utils import extract_uuid
+
+
+EXPECTED_SCHEMA = pa.schema(
+    [
+        pa.field("text", pa.string(), nullable=False),
+        pa.field("found_in_fw", pa.bool_()),
+    ]
+)
+
+
+@pytest.mark.parametrize(
+    "table, should_raise",
+    [
+        # Test case 1: Same columns, nullable fields can be read as non-nullable
+        (pa.table({"text": ["a", "b"], "found_in_fw": [True, None]}), False),
+        # Test case 2: Missing column
+        (pa.table({"text": ["a", "b"]}), True),
+        # Test case 3: Renamed column
+        (pa.table({"text": ["a", "b"], "found_in_fw2": [True, False]}), True),
+    ],
+)
+def test_verify_parquet_schema(tmp_path, table, should_raise):
+    pfout = tmp_path / "data.parquet"
+    pq.write_table(table, pfout)
+
+    if should_raise:
+        with pytest.raises(Exception, match="Could not read modified"):
+            verify_parquet_schema(pfout, EXPECTED_SCHEMA)
+    else:
+        verify_parquet_schema(pfout, EXPECTED_SCHEMA)
+
+
+@pytest.mark.parametrize(
+    "url, remove_domains, expected_keep",
+    [
+        # Test case 1: Exact domain match
+        ("https://example.com/page", {"example.com"}, False),
+        # Test case 2: Subdomains of a removed domain are removed too
+        ("https://www.example.com/page", {"example.com"}, False),
+        ("http://user:pw@news.bbc.co.uk:80/a?b=c", {"bbc.co.uk"}, False),
+        # Test case 3: Matching is case-insensitive and ignores trailing dots
+        ("https://WWW.Example.COM./", {"example.com"}, False),
+        ("https://example.com/", {"Example.com"}, False),
+        # Test case 4: Other domains that merely end with the same characters are kept
+        ("https://notexample.com/", {"example.com"}, True),
+        ("https://example.com.au/", {"example.com"}, True),
+        # Test case 5: The domain only occurring in the path is kept
+        ("https://other.org/example.com", {"example.com"}, True),
+        # Test case 6: URLs without a host and missing URLs are kept
+        ("not a url", {"example.com"}, True),
+        (None, {"example.com"}, True),
+        # Test case 7: Nothing to remove
+        ("https://example.com/", set(), True),
+    ],
+)
+def test_compute_keep_mask(url, remove_domains, expected_keep):
+    mask = compute_keep_mask(pa.array([url], type=pa.string()), remove_domains)
+    assert mask.to_pylist() == [expected_keep]
+
+
+@pytest.mark.parametrize(
+    "uuid_urn",
+    [
+        # Test case 1: Regular URN
+        "<urn:uuid:6a8657b3-84d0-45df-b4b2-5fb6eef55ee5>",
+        # Test case 2: URN without dashes
+        "<urn:uuid:6a8657b384d045dfb4b25fb6eef55ee5>",
+        # Test case 3: Not a URN, returned as-is (minus dashes)
+        "6a8657b3-84d0-45df-b4b2-5fb6eef55ee5",
+        # Test case 4: Missing ID
+        None,
+    ],
+)
+def test_extract_uuids(uuid_urn):
+    expected = extract_uuid(uuid_urn) if uuid_urn is not None else None
+    assert extract_uuids(pa.array([uuid_urn], type=pa.string())).to_pylist() == [expected]
+
+
+@pytest.mark.parametrize(
+    "fail_while_writing",
+    [
+        # Test case 1: Successful write replaces the original file
+        False,
+        # Test case 2: Failed write keeps the original file
+        True,
+    ],
+)
+def test_atomic_parquet_writer(tmp_path, fail_while_writing):
+    pfout = tmp_path / "data.parquet"
+    original = pa.table({"text": ["a", "b"]})
+    new = pa.table({"text": ["c"]})
+    pq.write_table(original, pfout)
+
+    if fail_while_writing:
+        with pytest.raises(RuntimeError):
+            with atomic_parquet_writer(pfout, new.schema) as writer:
+                writer.write_table(new)
+                raise RuntimeError("Failed while writing")
+        assert pq.read_table(pfout).equals(original)
+    else:
+        with atomic_parquet_writer(pfout, new.schema) as writer:
+            writer.write_table(new)
+        assert pq.read_table(pfout).equals(new)
+
+    assert [p.name for p in tmp_path.iterdir()] == ["data.parquet"]
+
+
+@pytest.mark.parametrize(
+    "content, expected",
+    [
+        # Test case 1: Regular file
+        ('{"a": 1}\n{"a": 2}\n', [{"a": 1}, {"a": 2}]),
+        # Test case 2: Incomplete last line (e.g. interrupted write) is skipped
+        ('{"a": 1}\n{"a": 2}\n{"a": ', [{"a": 1}, {"a": 2}]),
+        # Test case 3: Malformed line in the middle is skipped
+        ('{"a": 1}\nnot json\n{"a": 3}\n', [{"a": 1}, {"a": 3}]),
+        # Test case 4: Non-ASCII text
+        ('{"text": "café ✓"}\n', [{"text": "café ✓"}]),
+    ],
+)
+def test_yield_jsonl_gz_data_robust(tmp_path, content, expected):
+    pfin = tmp_path / "data.jsonl.gz"
+    with gzip.open(pfin, "wt", encoding="utf-8") as fhout:
+        fhout.write(content)
+    # Empty files are skipped
+    (tmp_path / "empty.jsonl.gz").touch()
+
+    assert list(yield_jsonl_gz_data_robust([tmp_path / "empty.jsonl.gz", pfin], disable_tqdm=True)) == expected
+
+
+@pytest.mark.parametrize(
+    "num_workers",
+    [
+        # Test case 1: Sequential reading in the main process
+        1,
+        # Test case 2: Fewer workers than files
+        2,
+        # Test case 3: More workers than files
+        8,
+    ],
+)
+def test_yield_jsonl_gz_data_robust_order(tmp_path, num_workers):
+    pfiles = []
+    for file_idx in range(5):
+        pfin = tmp_path / f"{file_idx}.jsonl.gz"
+        with gzip.open(pfin, "wt", encoding="utf-8") as fhout:
+            for line_idx in range(100):
+                fhout.write(json.dumps({"file": file_idx, "line": line_idx}) + "\n")
+        pfiles.append(pfin)
+
+    records = list(yield_jsonl_gz_data_robust(pfiles, disable_tqdm=True, num_workers=num_workers))
+    assert records == [{"file": file_idx, "line": line_idx} for file_idx in range(5) for line_idx in range(100)]
+
+
+def test_yield_jsonl_gz_data_robust_truncated_gzip(tmp_path):
+    pfin = tmp_path / "data.jsonl.gz"
+    data = gzip.compress("".join(json.dumps({"a": idx}) + "\n" for idx in range(1000)).encode("utf-8"))
+    # Cut off the gzip stream, as happens when a writer is killed
+    pfin.write_bytes(data[: len(data) // 2])
+
+    records = list(yield_jsonl_gz_data_robust([pfin], disable_tqdm=True))
+    assert records == [{"a": idx} for idx in range(len(records))]
+
+
+@pytest.mark.parametrize(
+    "num_workers, drop_keys, expected",
+    [
+        # Test case 1: Nothing to drop
+        (1, (), [{"id": 0, "text": "a"}, {"id": 1, "text": "b"}]),
+        # Test case 2: Drop the text while parsing
+        (1, ("text",), [{"id": 0}, {"id": 1}]),
+        # Test case 3: Drop the text in the worker processes
+        (2, ("text",), [{"id": 0}, {"id": 1}]),
+        # Test case 4: Keys that do not exist are ignored
+        (1, ("text", "url"), [{"id": 0}, {"id": 1}]),
+    ],
+)
+def test_yield_jsonl_gz_data_robust_drop_keys(tmp_path, num_workers, drop_keys, expected):
+    pfin = tmp_path / "data.jsonl.gz"
+    with gzip.open(pfin, "wt", encoding="utf-8") as fhout:
+        fhout.write('{"id": 0, "text": "a"}\n{"id": 1, "text": "b"}\n')
+
+    records = list(yield_jsonl_gz_data_robust([pfin], disable_tqdm=True, num_workers=num_workers, drop_keys=drop_keys))
+    assert records == expected
+
+
+@pytest.mark.parametrize(
+    "num_consumed",
+    [
+        # Test case 1: Everything is consumed
+        10,
+        # Test case 2: The consumer stops after the first item
+        1,
+        # Test case 3: The consumer never starts, so nothing is fetched
+        0,
+    ],
+)
+def test_prefetch_stops_early(num_consumed):
+    produced = []
+    closed = []
+
+    def items():
+        try:
+            for idx in range(10):
+                produced.append(idx)
+                yield idx
+        finally:
+            closed.append(True)
+
+    discarded = []
+    gen = prefetch(items(), buffer_size=2, discard=discarded.append)
+    consumed = [item for _, item in zip(range(num_consumed), gen)]
+    gen.close()
+
+    assert consumed == list(range(num_consumed))
+    # Every produced item is either consumed or discarded, and the iterable is closed
+    assert sorted(consumed + discarded) == produced
+    assert closed == ([True] if num_consumed else [])
+
+
+def test_prefetch_raises():
+    def items():
+        yield 1
+        raise ValueError("Failed to fetch")
+
+    with pytest.raises(ValueError, match="Failed to fetch"):
+        list(prefetch(items()))
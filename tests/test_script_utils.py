@@ -1,5 +1,9 @@
+import json
+
 import pytest
-from c5.script_utils import get_dumps_with_duckdb
+import c5.script_utils
+from c5.script_utils import BaseConfig, RunPaths, get_dumps_with_duckdb, get_effective_num_tasks
+from pydantic import ValidationError
 
 @pytest.mark.parametrize(
     "dump_name, ignore_duckdb_for, languages, expected_ignore_duckdb_for, expected_ignore_all_duckdb",
@@ -49,8 +53,119 @@ from c5.script_utils import get_dumps_with_duckdb
 def test_get_dumps_with_duckdb(
     dump_name, ignore_duckdb_for, languages, expected_ignore_duckdb_for, expected_ignore_all_duckdb
 ):
+    initial_ignore_duckdb_for = list(ignore_duckdb_for)
     result_ignore_duckdb_for, result_ignore_all_duckdb = get_dumps_with_duckdb(
         dump_name, languages, ignore_duckdb_for
     )
     assert set(result_ignore_duckdb_for) == set(expected_ignore_duckdb_for)
-    assert result_ignore_all_duckdb == expected_ignore_all_duckdb
\ No newline at end of file
+    assert result_ignore_all_duckdb == expected_ignore_all_duckdb
+    # The given list is not modified in-place
+    assert ignore_duckdb_for == initial_ignore_duckdb_for
+
+@pytest.mark.parametrize(
+    "fw_duckdb_templ_path, fw2_duckdb_templ_path, should_raise",
+    [
+        # Test case 1: Both templates contain their placeholder
+        ("duckdbs/fw-{dump}.duckdb", "duckdbs/fw2-{language}.duckdb", False),
+        # Test case 2: Templates are optional
+        (None, None, False),
+        # Test case 3: FineWeb template without the dump placeholder
+        ("duckdbs/fw.duckdb", "duckdbs/fw2-{language}.duckdb", True),
+        # Test case 4: FineWeb-2 template without the language placeholder
+        ("duckdbs/fw-{dump}.duckdb", "duckdbs/fw2-{dump}.duckdb", True),
+    ],
+)
+def test_base_config_duckdb_templ_paths(fw_duckdb_templ_path, fw2_duckdb_templ_path, should_raise):
+    kwargs = {
+        "languages": ["nld_Latn"],
+        "fw_duckdb_templ_path": fw_duckdb_templ_path,
+        "fw2_duckdb_templ_path": fw2_duckdb_templ_path,
+    }
+    if should_raise:
+        with pytest.raises(ValidationError, match="must contain the placeholder"):
+            BaseConfig(**kwargs)
+    else:
+        BaseConfig(**kwargs)
+
+
+@pytest.mark.parametrize(
+    "first_workers, resume_workers, expected_tasks",
+    [
+        # Test case 1: Resuming with the same number of workers
+        (8, 8, 8),
+        # Test case 2: Resuming with fewer workers keeps the tasks of the first run
+        (8, 4, 8),
+        # Test case 3: Resuming with more workers keeps the tasks of the first run
+        (4, 8, 4),
+    ],
+)
+def test_get_effective_num_tasks_resume(tmp_path, monkeypatch, first_workers, resume_workers, expected_tasks):
+    monkeypatch.setattr(c5.script_utils, "get_num_warc_files", lambda dump: 100)
+    logging_dir = str(tmp_path / "logs")
+
+    assert get_effective_num_tasks("CC-MAIN-2024-18", 1, first_workers, logging_dir=logging_dir) == first_workers
+    assert get_effective_num_tasks("CC-MAIN-2024-18", 1, resume_workers, logging_dir=logging_dir) == expected_tasks
+    # Without a logging directory, nothing is reused
+    assert get_effective_num_tasks("CC-MAIN-2024-18", 1, resume_workers) == resume_workers
+
+
+@pytest.mark.parametrize(
+    "executor_json, completions, expected_tasks",
+    [
+        # Test case 1: Previous run's executor.json has the world size
+        ({"world_size": 16, "tasks": 16}, ["00000"], 16),
+        # Test case 2: Only completions, falls back to the configured number of tasks
+        (None, ["00000", "00001"], 2),
+        # Test case 3: Unreadable executor.json, falls back to the configured number of tasks
+        ("not json", [], 2),
+        # Test case 4: Fresh logging directory, the number of tasks is increased
+        (None, [], 48),
+    ],
+)
+def test_get_effective_num_tasks_legacy_run(tmp_path, monkeypatch, executor_json, completions, expected_tasks):
+    monkeypatch.setattr(c5.script_utils, "get_num_warc_files", lambda dump: 100)
+    logging_dir = tmp_path / "logs"
+    logging_dir.mkdir()
+    if executor_json is not None:
+        content = executor_json if isinstance(executor_json, str) else json.dumps(executor_json)
+        (logging_dir / "executor.json").write_text(content, encoding="utf-8")
+    if completions:
+        (logging_dir / "completions").mkdir()
+        for rank in completions:
+            (logging_dir / "completions" / rank).touch()
+
+    assert get_effective_num_tasks("CC-MAIN-2024-18", 2, 48, logging_dir=str(logging_dir)) == expected_tasks
+    # The number of tasks is saved, so that it is also kept in later runs
+    assert get_effective_num_tasks("CC-MAIN-2024-18", 2, 8, logging_dir=str(logging_dir)) == expected_tasks
+
+
+@pytest.mark.parametrize(
+    "has_completions, has_output, expected",
+    [
+        # Test case 1: Fresh run
+        (False, False, False),
+        # Test case 2: Completed main tasks that wrote intermediate output
+        (True, True, True),
+        # Test case 3: Completed main tasks that wrote the final output themselves
+        (True, False, False),
+        # Test case 4: Leftover output without completed tasks
+        (False, True, False),
+    ],
+)
+def test_run_paths_has_intermediate_main_output(tmp_path, has_completions, has_output, expected):
+    paths = RunPaths.from_output_path(str(tmp_path / "output"), "CC-MAIN-2024-18")
+    paths = RunPaths(
+        main_output_dir=paths.main_output_dir,
+        containment_output_dir=paths.containment_output_dir,
+        main_logs_dir=str(tmp_path / "logs"),
+        containment_logs_dir=paths.containment_logs_dir,
+        main_slurm_logs_dir=paths.main_slurm_logs_dir,
+        containment_slurm_logs_dir=paths.containment_slurm_logs_dir,
+    )
+    if has_completions:
+        (tmp_path / "logs" / "completions").mkdir(parents=True)
+        (tmp_path / "logs" / "completions" / "00000").touch()
+    if has_output:
+        (tmp_path / "output-main" / "CC-MAIN-2024-18" / "nld_Latn").mkdir(parents=True)
+
+    assert paths.has_intermediate_main_output() == expected
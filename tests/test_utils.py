@@ -0,0 +1,31 @@
+import duckdb
+import pytest
+
+from c5.utils import query_containment
+
+
+FOUND_ID = "6a8657b384d045dfb4b25fb6eef55ee5"
+MISSING_ID = "6a8657b384d045dfb4b25fb6eef55ee6"
+
+
+@pytest.mark.parametrize(
+    "ids, dumps, expected",
+    [
+        # Test case 1: Only match on id (FineWeb)
+        ([MISSING_ID, FOUND_ID, FOUND_ID], None, [False, True, True]),
+        # Test case 2: Match on dump and id (FineWeb-2)
+        (
+            [FOUND_ID, FOUND_ID, MISSING_ID],
+            ["CC-MAIN-2024-10", "CC-MAIN-2023-50", "CC-MAIN-2024-10"],
+            [True, False, False],
+        ),
+        # Test case 3: Empty batch
+        ([], None, []),
+    ],
+)
+def test_query_containment(ids, dumps, expected):
+    con = duckdb.connect()
+    con.execute(f"CREATE TABLE data AS SELECT 'CC-MAIN-2024-10' AS dump, '{FOUND_ID}'::UUID AS id")
+
+    assert query_containment(con, ids, dumps) == expected
+    con.close()